@@ -0,0 +1,89 @@
+"""
+CPU throughput benchmark for VideoAnalyzer.process_video.
+
+Runs the same frames through the per-frame thread pool, the micro-batched
+path, the staged pipeline and the process-pool backend and reports
+frames/sec for each, plus per-stage utilization for the pipeline. Those
+runs disable the encode cache and near-duplicate reuse, so every frame is
+decoded, encoded and queried; a separate run then measures the defaults
+(cache and reuse on) cold and warm, with their hit counts. Needs the
+moondream model file; frames all point at --image unless --images is
+given. Process workers load the model themselves, so pass --skip-process
+to leave that run out on machines without the memory for several copies.
+
+    python bench_analyzer.py --frames 32 --workers 4 --batch-size 8
+"""
+import argparse
+import time
+
+from main import EncodedImageCache, FrameDeduplicator, HierarchicalGeoStore, VideoAnalyzer
+
+
+def run(analyzer, frames, workers, batch_size, backend="thread"):
+    analyzer.geo_store = HierarchicalGeoStore(metrics=analyzer.metrics)
+    start = time.perf_counter()
+    analyzer.process_video(frames, max_workers=workers, batch_size=batch_size, backend=backend)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def run_pipeline(analyzer, frames, pipeline):
+    analyzer.geo_store = HierarchicalGeoStore(metrics=analyzer.metrics)
+    start = time.perf_counter()
+    for _ in analyzer.run_pipeline(frames, pipeline):
+        pass
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="moondream-0_5b-int8.mf")
+    parser.add_argument("--image", default="man.webp")
+    parser.add_argument("--images", nargs="*", help="cycle through these frames instead of --image")
+    parser.add_argument("--frames", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--encode-workers", type=int, default=1)
+    parser.add_argument("--query-workers", type=int, default=1)
+    parser.add_argument("--skip-process", action="store_true")
+    parser.add_argument("--metrics-json", help="write the analyzer's metrics here after the runs")
+    args = parser.parse_args()
+
+    paths = args.images or [args.image]
+    frames = [{"frame_id": i, "path": paths[i % len(paths)], "lat": 37.7749 + i * 1e-4,
+               "lon": -122.4194, "time": float(i)} for i in range(args.frames)]
+    # Frames repeat the same few images, so cache or reuse hits would
+    # stand in for model work in these numbers
+    analyzer = VideoAnalyzer(args.model, cache_bytes=0, dedup_distance=None)
+    # Warm up so one-time model initialization is not counted
+    run(analyzer, frames[:1], 1, 1)
+
+    per_frame = run(analyzer, frames, args.workers, 1)
+    batched = run(analyzer, frames, args.workers, args.batch_size)
+    print(f"per-frame ({args.workers} workers):      {per_frame:.2f} frames/s")
+    print(f"batched (size {args.batch_size}, {args.workers} decoders): {batched:.2f} frames/s")
+    pipeline = analyzer.frame_pipeline(decode=(args.workers, 4 * args.workers),
+                                       encode=(args.encode_workers, 4), query=(args.query_workers, 4))
+    staged = run_pipeline(analyzer, frames, pipeline)
+    print(f"pipeline ({args.workers}/{args.encode_workers}/{args.query_workers} "
+          f"decode/encode/query workers): {staged:.2f} frames/s")
+    print(pipeline.report())
+    if not args.skip_process:
+        # Includes worker start-up and per-process model load
+        processes = run(analyzer, frames, args.workers, args.batch_size, backend="process")
+        print(f"process ({args.workers} workers, chunks of {args.batch_size}): {processes:.2f} frames/s")
+
+    reuse = VideoAnalyzer(args.model)
+    run(reuse, frames[:1], 1, 1)
+    # Start the first pass cold: forget the warm-up frame
+    reuse.encode_cache, reuse.dedup = EncodedImageCache(), FrameDeduplicator()
+    cold = run(reuse, frames, args.workers, 1)
+    warm = run(reuse, frames, args.workers, 1)
+    print(f"per-frame with encode cache and reuse: {cold:.2f} frames/s first pass, {warm:.2f} repeated; "
+          f"{reuse.encode_cache.hits} cache hits, {reuse.dedup.reused} answers reused "
+          f"of {2 * len(frames)} frames")
+    if args.metrics_json:
+        analyzer.metrics.dump_json(args.metrics_json)
+
+
+if __name__ == "__main__":
+    main()
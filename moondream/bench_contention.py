@@ -0,0 +1,79 @@
+"""
+Contention benchmark for HierarchicalGeoStore inserts.
+
+Each worker thread simulates a frame (optionally sleeping for --work-ms to
+stand in for model inference, which releases the GIL) and then inserts an
+observation. The striped store is compared with a store whose inserts are
+serialized on one global lock, the way add_observation used to work.
+
+    python bench_contention.py --frames 20000 --workers 1 2 4 8 16
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from main import HierarchicalGeoStore, Observation
+
+VOCAB = ("flooded street car pothole debris fallen tree fire smoke crash "
+         "cone lane blocked truck bus signal pedestrian bike construction").split()
+
+
+class GlobalLockStore(HierarchicalGeoStore):
+    """
+    Baseline: every insert holds one store-wide lock.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._global = threading.Lock()
+
+    def add_observation(self, lat, lon, obs):
+        with self._global:
+            super().add_observation(lat, lon, obs)
+
+
+def make_frames(n, seed=0):
+    rng = random.Random(seed)
+    frames = []
+    for i in range(n):
+        lat = 37.70 + rng.random() * 0.12
+        lon = -122.52 + rng.random() * 0.15
+        text = " ".join(rng.sample(VOCAB, 4))
+        frames.append((i, lat, lon, text, rng.randint(1, 5)))
+    return frames
+
+
+def run(store, frames, workers, work_s):
+    def handle(frame):
+        frame_id, lat, lon, text, urgency = frame
+        if work_s:
+            time.sleep(work_s)
+        store.add_observation(lat, lon, Observation(
+            text, urgency, [{"time": float(frame_id), "lat": lat, "lon": lon, "frame_id": frame_id}]))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(handle, frames, chunksize=64):
+            pass
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--work-ms", type=float, default=0.0,
+                        help="simulated per-frame inference time outside the store")
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames)
+    print(f"{'workers':>8} {'global ins/s':>14} {'striped ins/s':>14} {'speedup':>8}")
+    for workers in args.workers:
+        baseline = run(GlobalLockStore(), frames, workers, args.work_ms / 1000)
+        striped = run(HierarchicalGeoStore(), frames, workers, args.work_ms / 1000)
+        print(f"{workers:>8} {baseline:>14.0f} {striped:>14.0f} {striped / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Synthetic-load benchmark for HierarchicalGeoStore, no model needed.
+
+Observations come from a generated stream: vehicles tracing random walks
+around clusters spread over a city, each reporting hazard text drawn from a
+fixed vocabulary. --duplication is the chance that a report repeats (or
+slightly varies) a recent report from the same cluster, which is what
+drives merges. For each size the suite measures insert throughput, merge
+rate, resident memory per observation, and latency of radius, bbox,
+nearest-k and per-cell top-urgent queries. --json appends one line per size (with the git commit)
+so numbers can be compared across commits.
+
+    python bench_geo.py --sizes 10000 1000000 10000000 --json geo_bench.jsonl
+
+The 10M size takes a long time and several GB of memory.
+"""
+import argparse
+import bisect
+import gc
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import time
+from collections import deque
+
+from main import HierarchicalGeoStore, MinHashLSH, Observation, KM_PER_DEGREE, cell_for
+from telemetry import Histogram
+
+HAZARDS = ("flooded street", "fallen tree", "debris in road", "car crash", "stalled truck",
+           "pothole", "downed power line", "fire", "heavy smoke", "construction zone",
+           "blocked lane", "broken traffic signal", "pedestrian in road", "sinkhole", "ice on road")
+MODIFIERS = ("near intersection", "in left lane", "in right lane", "on sidewalk", "by bus stop",
+             "near parked car", "under bridge", "at crosswalk", "next to school", "on ramp")
+
+
+def observation_stream(n, seed=0, clusters=200, duplication=0.5,
+                       center=(37.7749, -122.4194), spread_km=15.0, step_km=0.05):
+    """
+    Yield n (lat, lon, text, urgency, time) tuples. Clusters are placed
+    around center with a Gaussian spread and picked with a skewed (Zipf-like)
+    popularity; each one's position moves by a random step per report.
+    """
+    rng = random.Random(seed)
+    spread = spread_km / KM_PER_DEGREE
+    step = step_km / KM_PER_DEGREE
+    lon_scale = 1 / math.cos(math.radians(center[0]))
+    centers = [(center[0] + rng.gauss(0, spread), center[1] + rng.gauss(0, spread) * lon_scale)
+               for _ in range(clusters)]
+    positions = list(centers)
+    cumulative, total = [], 0.0
+    for rank in range(clusters):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    recent = [deque(maxlen=8) for _ in range(clusters)]
+    for i in range(n):
+        c = min(bisect.bisect(cumulative, rng.random() * total), clusters - 1)
+        if rng.random() < 0.01:
+            positions[c] = centers[c]  # a new vehicle starts at the cluster center
+        lat, lon = positions[c]
+        lat += rng.gauss(0, step)
+        lon += rng.gauss(0, step) * lon_scale
+        positions[c] = (lat, lon)
+        if recent[c] and rng.random() < duplication:
+            hazard, modifier = rng.choice(recent[c])
+            if rng.random() < 0.3:  # near-duplicate: same hazard, different detail
+                modifier = rng.choice(MODIFIERS)
+        else:
+            hazard, modifier = rng.choice(HAZARDS), rng.choice(MODIFIERS)
+            recent[c].append((hazard, modifier))
+        yield lat, lon, f"{hazard} {modifier}", rng.randint(1, 5), float(i)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def time_queries(store, count, seed, center=(37.7749, -122.4194), spread_km=15.0):
+    rng = random.Random(seed)
+    spread = spread_km / KM_PER_DEGREE
+    lon_scale = 1 / math.cos(math.radians(center[0]))
+    points = [(center[0] + rng.gauss(0, spread), center[1] + rng.gauss(0, spread) * lon_scale)
+              for _ in range(count)]
+    box = 0.5 / KM_PER_DEGREE
+    queries = {
+        "radius_0.5km": lambda lat, lon: store.query_radius(lat, lon, 0.5),
+        "bbox_1km": lambda lat, lon: store.query_bbox(lat - box, lon - box, lat + box, lon + box),
+        "nearest_10": lambda lat, lon: store.nearest_k(lat, lon, 10),
+        "top_urgent_10_cell": lambda lat, lon: store.top_urgent(10, cell_for(lat, lon, store.zoom_levels[-1])),
+    }
+    latencies = {}
+    for name, query in queries.items():
+        histogram = Histogram()
+        for lat, lon in points:
+            with histogram.time():
+                query(lat, lon)
+        latencies[name] = histogram.snapshot()
+    return latencies
+
+
+def run(size, args):
+    gc.collect()
+    store = HierarchicalGeoStore(lsh=MinHashLSH() if args.lsh else None)
+    stream = observation_stream(size, seed=args.seed, clusters=args.clusters, duplication=args.duplication)
+    before = rss_bytes()
+    start = time.perf_counter()
+    for frame_id, (lat, lon, text, urgency, t) in enumerate(stream):
+        store.add_observation(lat, lon, Observation(
+            text, urgency, [{"time": t, "lat": lat, "lon": lon, "frame_id": frame_id}]))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    grown = rss_bytes() - before
+
+    counters = store.metrics.snapshot()["counters"]
+    inserted = counters["geo.added"] + counters["geo.merged"]
+    latencies = time_queries(store, args.queries, args.seed + 1)
+    return {
+        "size": size,
+        "inserts_per_s": size / elapsed,
+        "merge_rate": counters["geo.merged"] / inserted if inserted else 0.0,
+        "stored": store.entry_count,
+        "bins": len(store.bins),
+        "bytes_per_input": grown / size,
+        "bytes_per_stored": grown / max(store.entry_count, 1),
+        "query_p50_ms": {name: h["p50"] * 1e3 for name, h in latencies.items()},
+        "query_p99_ms": {name: h["p99"] * 1e3 for name, h in latencies.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000, 10000000])
+    parser.add_argument("--duplication", type=float, default=0.5,
+                        help="chance a report repeats a recent report from its cluster")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200, help="queries timed per kind")
+    parser.add_argument("--lsh", action="store_true", help="use MinHash/LSH merge candidates")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="append one JSON line per size to this file")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    print(f"{'size':>10} {'ins/s':>9} {'merge':>6} {'stored':>10} {'B/obs':>7} "
+          f"{'radius p50/p99 ms':>18} {'bbox p50/p99 ms':>16} {'knn p50/p99 ms':>15}")
+    for size in args.sizes:
+        row = run(size, args)
+        p50, p99 = row["query_p50_ms"], row["query_p99_ms"]
+        print(f"{size:>10} {row['inserts_per_s']:>9.0f} {row['merge_rate']:>6.1%} {row['stored']:>10} "
+              f"{row['bytes_per_stored']:>7.0f} "
+              f"{p50['radius_0.5km']:>8.2f}/{p99['radius_0.5km']:<9.2f}"
+              f"{p50['bbox_1km']:>7.2f}/{p99['bbox_1km']:<8.2f}"
+              f"{p50['nearest_10']:>6.2f}/{p99['nearest_10']:<8.2f}")
+        if args.json:
+            row.update(commit=commit, time=time.time(), duplication=args.duplication,
+                       clusters=args.clusters, lsh=args.lsh, seed=args.seed)
+            with open(args.json, "a") as f:
+                f.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark the NumPy geo kernels against the scalar haversine_distance.
+
+For each size n, distances from one point to n points are timed with a
+Python loop over haversine_distance, with haversine_to_many and with
+equirectangular_to_many, along with bearing_to_many. Points lie within
+--spread-km of the origin, the range the store's queries work at. The
+largest deviation from the scalar result is reported next to each kernel.
+An n x n matrix is then timed in chunks (scalar extrapolated from a
+sample row).
+
+    python bench_kernels.py --sizes 10 100 1000 10000 100000 --matrix 4000
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from main import haversine_distance, KM_PER_DEGREE
+from geo_kernels import (haversine_to_many, haversine_matrix, equirectangular_to_many,
+                         bearing_to_many)
+
+
+def best_of(fn, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def points(n, origin, spread_km, rng):
+    spread = spread_km / KM_PER_DEGREE
+    lats = origin[0] + rng.uniform(-spread, spread, n)
+    lons = origin[1] + rng.uniform(-spread, spread, n) / math.cos(math.radians(origin[0]))
+    return lats, lons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--matrix", type=int, default=4000, help="side of the n x n distance matrix")
+    parser.add_argument("--spread-km", type=float, default=10.0)
+    parser.add_argument("--lat", type=float, default=37.7749)
+    parser.add_argument("--lon", type=float, default=-122.4194)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    origin = (args.lat, args.lon)
+    print(f"{'n':>8} {'scalar ms':>10} {'haversine ms':>13} {'x':>6} {'equirect ms':>12} {'x':>6} "
+          f"{'bearing ms':>11} {'max err m (hav/eq)':>19}")
+    for n in args.sizes:
+        lats, lons = points(n, origin, args.spread_km, rng)
+        lat_list, lon_list = lats.tolist(), lons.tolist()
+        scalar_t, scalar = best_of(lambda: [haversine_distance(args.lat, args.lon, la, lo)
+                                            for la, lo in zip(lat_list, lon_list)], args.repeat)
+        scalar = np.array(scalar)
+        hav_t, hav = best_of(lambda: haversine_to_many(args.lat, args.lon, lats, lons), args.repeat)
+        eq_t, eq = best_of(lambda: equirectangular_to_many(args.lat, args.lon, lats, lons), args.repeat)
+        bearing_t, _ = best_of(lambda: bearing_to_many(args.lat, args.lon, lats, lons), args.repeat)
+        print(f"{n:>8} {scalar_t * 1e3:>10.3f} {hav_t * 1e3:>13.3f} {scalar_t / hav_t:>6.1f} "
+              f"{eq_t * 1e3:>12.3f} {scalar_t / eq_t:>6.1f} {bearing_t * 1e3:>11.3f} "
+              f"{np.abs(hav - scalar).max() * 1e3:>9.2e}/{np.abs(eq - scalar).max() * 1e3:<9.2e}")
+
+    if args.matrix:
+        n = args.matrix
+        lats, lons = points(n, origin, args.spread_km, rng)
+        matrix_t, _ = best_of(lambda: haversine_matrix(lats, lons, lats, lons), 1)
+        row = list(zip(lats.tolist(), lons.tolist()))
+        sample = min(n, 100)
+        start = time.perf_counter()
+        for la, lo in row[:sample]:
+            for la2, lo2 in row:
+                haversine_distance(la, lo, la2, lo2)
+        scalar_t = (time.perf_counter() - start) * n / sample
+        print(f"{n}x{n} matrix: chunked kernel {matrix_t:.3f}s, scalar ~{scalar_t:.1f}s "
+              f"(from {sample} rows), {scalar_t / matrix_t:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
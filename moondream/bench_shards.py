@@ -0,0 +1,103 @@
+"""
+Shard-merge check and benchmark for HierarchicalGeoStore.
+
+Each worker process stands in for one vehicle's analyzer: it fills a private
+store from its own slice of the bench_geo observation stream, and ships back
+a ShardSnapshot as bytes twice, once halfway through and once at the end, the
+way a periodic upload would. The coordinator folds every upload together
+and checks that:
+
+    - no source is lost or counted twice (the halfway uploads overlap the
+      final ones),
+    - folding the result with any upload again changes nothing,
+    - folding in reverse order keeps the same sources in every cell.
+
+It reports shard sizes and merge throughput, and compares the merged view
+with one store fed every report directly.
+
+    python bench_shards.py --workers 4 --reports 50000
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from main import HierarchicalGeoStore, Observation, ShardSnapshot
+from bench_geo import observation_stream
+
+
+def reports(worker, count, args):
+    # Each worker drives its own clusters around the same city center
+    for frame_id, (lat, lon, text, urgency, t) in enumerate(observation_stream(
+            count, seed=args.seed + 1 + worker, clusters=args.clusters, duplication=args.duplication)):
+        yield frame_id, lat, lon, text, urgency, t
+
+
+def build_shard(worker, count, args):
+    store = HierarchicalGeoStore()
+    uploads = []
+    for frame_id, lat, lon, text, urgency, t in reports(worker, count, args):
+        store.add_observation(lat, lon, Observation(
+            text, urgency, [{"time": t, "lat": lat, "lon": lon, "frame_id": frame_id}]))
+        if frame_id == count // 2:
+            uploads.append(store.shard_snapshot().to_bytes())
+    uploads.append(store.shard_snapshot().to_bytes())
+    return uploads
+
+
+def cell_sources(shard):
+    cells = {}
+    for key, obs in shard.items:
+        cells.setdefault(key, Counter()).update(obs.source_ids())
+    return cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--reports", type=int, default=50000, help="reports per worker")
+    parser.add_argument("--duplication", type=float, default=0.5)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        uploads = [blob for blobs in pool.map(build_shard, range(args.workers),
+                                              [args.reports] * args.workers, [args] * args.workers)
+                   for blob in blobs]
+    print(f"{args.workers} workers built shards in {time.perf_counter() - start:.2f}s; "
+          f"{len(uploads)} uploads, {sum(map(len, uploads)) / len(uploads) / 1e6:.2f} MB each on average")
+
+    start = time.perf_counter()
+    shards = [ShardSnapshot.from_bytes(blob) for blob in uploads]
+    decoded = time.perf_counter() - start
+    incoming = sum(len(shard.items) for shard in shards)
+    start = time.perf_counter()
+    merged = shards[0].merge(*shards[1:])
+    elapsed = time.perf_counter() - start
+    print(f"decode {decoded:.2f}s, merge {elapsed:.2f}s ({incoming / elapsed:.0f} observations/s) "
+          f"-> {len(merged.items)} observations")
+
+    expected = args.workers * args.reports
+    assert merged.source_count == expected, (merged.source_count, expected)
+    by_cell = cell_sources(merged)
+    assert all(n == 1 for sources in by_cell.values() for n in sources.values()), "a source was stored twice"
+    for shard in shards:
+        again = merged.merge(shard)
+        assert again.source_count == expected and len(again.items) == len(merged.items)
+    reverse = shards[-1].merge(*reversed(shards[:-1]))
+    assert cell_sources(reverse) == by_cell
+    print(f"ok: {expected} sources kept exactly once; re-merging and reverse order agree "
+          f"(reverse order grouped them into {len(reverse.items)} observations)")
+
+    direct = HierarchicalGeoStore()
+    for worker in range(args.workers):
+        for frame_id, lat, lon, text, urgency, t in reports(worker, args.reports, args):
+            direct.add_observation(lat, lon, Observation(
+                text, urgency, [{"time": t, "lat": lat, "lon": lon, "frame_id": frame_id}]))
+    print(f"one store fed every report directly holds {direct.entry_count} observations")
+
+
+if __name__ == "__main__":
+    main()
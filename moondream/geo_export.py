@@ -0,0 +1,115 @@
+"""
+Columnar export of HierarchicalGeoStore cells for map layers.
+
+One row per occupied cell, at every zoom level, finest zoom first and
+then by x, y:
+
+    zoom, x, y          cell key (see cell_bounds / cell_center)
+    cell_id             the key packed as zoom << 58 | x << 29 | y (unique up to zoom 29)
+    lat, lon            centroid of the sources below the cell
+    count, sources      observations and sources below the cell
+    max_urgency         highest urgency below the cell
+    text_offsets        row i's texts are text_buffer[text_offsets[i]:text_offsets[i + 1]],
+                        utf-8, most reported first, newline-separated
+    text_buffer         every row's texts back to back
+    level_offsets       rows of zoom_levels[j] are level_offsets[j]:level_offsets[j + 1]
+    zoom_levels         zooms present, finest first
+    version             store version the export reflects
+
+The file is an uncompressed .npz; read_columns memory-maps each array
+straight out of it, so opening even a large export costs a few
+milliseconds and pages are read only when touched.
+"""
+import os
+import struct
+import zipfile
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Zip local file header: signature, versions/flags, sizes, name and extra lengths
+_ZIP_LOCAL = struct.Struct("<4s5H3L2H")
+
+
+def cell_ids(zoom: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    return (zoom.astype(np.uint64) << np.uint64(58)) | (x.astype(np.uint64) << np.uint64(29)) \
+        | y.astype(np.uint64)
+
+
+def write_columns(path: str, rows: Iterable[Tuple], zoom_levels: List[int], version: int):
+    """
+    Atomically write rows of (key, lat, lon, count, sources, max_urgency, texts)
+    as a columnar export; rows must be sorted by key with zoom descending.
+    """
+    rows = list(rows)
+    n = len(rows)
+    zoom = np.fromiter((r[0][0] for r in rows), np.uint8, n)
+    x = np.fromiter((r[0][1] for r in rows), np.uint32, n)
+    y = np.fromiter((r[0][2] for r in rows), np.uint32, n)
+    encoded = ["\n".join(t.replace("\n", " ") for t in r[6]).encode() for r in rows]
+    text_offsets = np.zeros(n + 1, np.uint64)
+    np.cumsum(np.fromiter(map(len, encoded), np.uint64, n), out=text_offsets[1:])
+    levels = np.array(zoom_levels, np.uint8)
+    # zoom is sorted descending; count rows at or above each level's zoom
+    level_offsets = np.concatenate(([0], np.searchsorted(-zoom.astype(np.int16), -levels.astype(np.int16),
+                                                         side="right"))).astype(np.uint64)
+    columns = {
+        "zoom": zoom,
+        "x": x,
+        "y": y,
+        "cell_id": cell_ids(zoom, x, y),
+        "lat": np.fromiter((r[1] for r in rows), np.float64, n),
+        "lon": np.fromiter((r[2] for r in rows), np.float64, n),
+        "count": np.fromiter((r[3] for r in rows), np.uint32, n),
+        "sources": np.fromiter((r[4] for r in rows), np.uint32, n),
+        "max_urgency": np.fromiter((r[5] for r in rows), np.int16, n),
+        "text_offsets": text_offsets,
+        "text_buffer": np.frombuffer(b"".join(encoded), np.uint8),
+        "level_offsets": level_offsets,
+        "zoom_levels": levels,
+        "version": np.array(version, np.int64),
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **columns)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_columns(path: str) -> Dict[str, np.ndarray]:
+    """
+    Open an export written by write_columns, with every non-empty array a
+    read-only memory map into the file (the scalar version is loaded).
+    """
+    columns = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                columns[name] = np.load(archive.open(info))
+                continue
+            f.seek(info.header_offset)
+            fields = _ZIP_LOCAL.unpack(f.read(_ZIP_LOCAL.size))
+            f.seek(info.header_offset + _ZIP_LOCAL.size + fields[-2] + fields[-1])
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if shape == () or 0 in shape:
+                columns[name] = np.load(archive.open(info))
+                continue
+            columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                      order="F" if fortran_order else "C")
+    return columns
+
+
+def row_texts(columns: Dict[str, np.ndarray], i: int) -> List[str]:
+    """
+    Decode row i's texts from an export.
+    """
+    start, end = columns["text_offsets"][i:i + 2]
+    if start == end:
+        return []
+    return bytes(columns["text_buffer"][int(start):int(end)]).decode().split("\n")
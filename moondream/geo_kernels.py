@@ -0,0 +1,132 @@
+"""
+NumPy distance and bearing kernels for many points at once.
+
+haversine_distance in main.py is the scalar reference; these compute the
+same great-circle distances (km, same Earth radius) for arrays of points:
+
+    haversine_to_many         one point to n points
+    haversine_matrix          n x m distances, built in row chunks
+    haversine_matrix_chunks   the same blocks one at a time, to reduce
+                              (e.g. nearest neighbour, pairs within a radius)
+                              without ever holding the full matrix
+    equirectangular_to_many   flat-Earth approximation for short ranges;
+                              points whose error bound exceeds max_rel_error
+                              are recomputed with haversine
+    bearing_to_many           initial great-circle bearing, degrees from north
+
+Inputs are degrees, as anything np.asarray accepts. An array("d") can be
+passed without copying via np.frombuffer, but only if nothing appends to it
+while the view exists (a resize then raises BufferError); copy live
+Observation columns under their bin lock first.
+"""
+from typing import Iterator, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Temporaries per matrix element in haversine_matrix_chunks, in float64s
+_TEMPS_PER_ELEMENT = 4
+
+
+def _haversine(lat1, cos_lat1, lon1, lat2, cos_lat2, lon2) -> np.ndarray:
+    """
+    Haversine on radians with the cosines precomputed; arguments broadcast.
+    """
+    a = np.sin((lat2 - lat1) * 0.5) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon2 - lon1) * 0.5) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def haversine_to_many(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """
+    Great-circle distances (km) from lat/lon to every (lats[i], lons[i]).
+    """
+    lat_r, lon_r = np.radians(lat), np.radians(lon)
+    lats_r = np.radians(np.asarray(lats, dtype=np.float64))
+    lons_r = np.radians(np.asarray(lons, dtype=np.float64))
+    return _haversine(lat_r, np.cos(lat_r), lon_r, lats_r, np.cos(lats_r), lons_r)
+
+
+def haversine_matrix_chunks(lats1, lons1, lats2, lons2,
+                            max_bytes: int = 64 << 20) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Yield (row_start, block) where block[i, j] is the distance (km) from
+    point row_start + i of the first set to point j of the second. Rows are
+    grouped so one block and its temporaries stay within about max_bytes.
+    """
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lons1 = np.radians(np.asarray(lons1, dtype=np.float64))
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    lons2 = np.radians(np.asarray(lons2, dtype=np.float64))
+    cos1, cos2 = np.cos(lats1), np.cos(lats2)
+    rows = max(1, max_bytes // (8 * _TEMPS_PER_ELEMENT * max(len(lats2), 1)))
+    for start in range(0, len(lats1), rows):
+        end = start + rows
+        yield start, _haversine(lats1[start:end, None], cos1[start:end, None], lons1[start:end, None],
+                                lats2[None, :], cos2[None, :], lons2[None, :])
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2, max_bytes: int = 64 << 20,
+                     dtype=np.float64) -> np.ndarray:
+    """
+    Full n x m distance matrix (km), computed in chunks so temporaries stay
+    within about max_bytes; pass dtype=np.float32 to halve the result.
+    """
+    out = np.empty((len(lats1), len(lats2)), dtype=dtype)
+    for start, block in haversine_matrix_chunks(lats1, lons1, lats2, lons2, max_bytes):
+        out[start:start + len(block)] = block
+    return out
+
+
+def equirectangular_to_many(lat: float, lon: float, lats, lons,
+                            max_rel_error: float = 1e-4) -> np.ndarray:
+    """
+    Distances (km) from lat/lon using the equirectangular approximation
+    (longitude scaled by the cosine of the mean latitude). Its relative
+    error stays below (d / R)^2 / (16 cos^2 phi), phi the larger absolute
+    latitude of the pair: about 6e-7 at 10 km and 60 degrees. Points where
+    that bound exceeds max_rel_error (long ranges, near the poles) are
+    recomputed with haversine, so every result is within max_rel_error.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lat_r = np.radians(lat)
+    y = np.radians(lats)
+    y -= lat_r
+    dlon = lons - lon
+    if dlon.size and np.abs(dlon).max() > 180.0:
+        # Wrap into [-180, 180) so pairs across the antimeridian stay short
+        dlon = (dlon + 180.0) % 360.0 - 180.0
+    x = np.radians(dlon, out=dlon)
+    x *= np.cos(y * 0.5 + lat_r)
+    x *= x
+    d = y * y
+    d += x
+    np.sqrt(d, out=d)
+    d *= EARTH_RADIUS_KM
+    if not d.size:
+        return d
+
+    # One conservative check for the whole batch; per point only if it fails
+    max_abs_lat = np.radians(max(abs(lat), np.abs(lats).max()))
+    if (d.max() / EARTH_RADIUS_KM) ** 2 <= max_rel_error * 16 * np.cos(max_abs_lat) ** 2:
+        return d
+    cos_phi = np.minimum(np.cos(lat_r), np.cos(np.radians(lats)))
+    redo = ~((d / EARTH_RADIUS_KM) ** 2 <= max_rel_error * 16 * cos_phi ** 2)
+    if redo.any():
+        d[redo] = haversine_to_many(lat, lon, lats[redo], lons[redo])
+    return d
+
+
+def bearing_to_many(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """
+    Initial great-circle bearing from lat/lon to each point, in degrees
+    clockwise from north in [0, 360).
+    """
+    lat_r = np.radians(lat)
+    lats_r = np.radians(np.asarray(lats, dtype=np.float64))
+    dlon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    y = np.sin(dlon) * np.cos(lats_r)
+    x = np.cos(lat_r) * np.sin(lats_r) - np.sin(lat_r) * np.cos(lats_r) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
@@ -0,0 +1,295 @@
+"""
+Append-only journal and compacted binary snapshots for HierarchicalGeoStore.
+
+Journal records describe bin mutations as they happened (add, merge, drop,
+prune), so a reload replays them without re-running similarity matching.
+Every record carries a log sequence number (LSN) and a CRC; replay stops at
+the first torn or corrupt record and truncates it away. Compaction moves
+the journal aside (GeoJournal.rotate) and deletes it once the snapshot
+covering it is written.
+
+Snapshots are a flat little-endian binary file read back through mmap:
+
+    header:  magic "GEOSNAP2", lsn q, version q, observation count q
+    per observation, grouped by bin in insertion order:
+        key      zoom i, x q, y q
+        obs      obs_id q, version q, urgency i, n_sources i, sig_len i, text_len I, details_len I
+        text     utf-8 bytes
+        details  utf-8 JSON object (empty when the observation has none)
+        columns  times d[n], lats d[n], lons d[n], frame_ids q[n]
+        sig      q[sig_len]
+
+Shard snapshots (a store's observations shipped to another process to be
+merged) use the same per-observation encoding in memory:
+
+    header:  magic "GEOSHRD1", level count i, observation count q
+    levels   radius_levels d[level count]
+    per observation, as in a snapshot
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+from array import array
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+ADD, MERGE, DROP, PRUNE = 1, 2, 3, 4
+
+_KEY = struct.Struct("<iqq")
+_OBS = struct.Struct("<qqiiiII")
+_MERGE = struct.Struct("<qqii")
+_PRUNE = struct.Struct("<qI")
+_DROP = struct.Struct("<q")
+_RECORD = struct.Struct("<IqB")  # payload length, lsn, kind
+_CRC = struct.Struct("<I")
+_SNAPSHOT = struct.Struct("<8sqqq")
+_MAGIC = b"GEOSNAP2"
+_SHARD = struct.Struct("<8siq")
+_SHARD_MAGIC = b"GEOSHRD1"
+
+
+def _pack_columns(obs) -> bytes:
+    return obs.times.tobytes() + obs.lats.tobytes() + obs.lons.tobytes() + obs.frame_ids.tobytes()
+
+
+def _unpack_columns(buf, offset: int, n: int) -> Tuple[Tuple[array, array, array, array], int]:
+    columns = []
+    for typecode in ("d", "d", "d", "q"):
+        column = array(typecode)
+        column.frombytes(buf[offset:offset + 8 * n])
+        columns.append(column)
+        offset += 8 * n
+    return tuple(columns), offset
+
+
+def _pack_observation(key, obs) -> bytes:
+    text = str(obs.environment).encode()
+    details = json.dumps(obs.details).encode() if obs.details else b""
+    signature = obs.signature or ()
+    return b"".join((
+        _KEY.pack(*key),
+        _OBS.pack(obs.obs_id, obs.version, obs.urgency, obs.source_count, len(signature),
+                  len(text), len(details)),
+        text,
+        details,
+        _pack_columns(obs),
+        struct.pack(f"<{len(signature)}q", *signature),
+    ))
+
+
+def _unpack_observation(buf, offset: int) -> Tuple[Tuple[Any, ...], int]:
+    """
+    Returns ((key, obs_id, version, urgency, text, details, columns, signature), next offset).
+    """
+    key = _KEY.unpack_from(buf, offset)
+    offset += _KEY.size
+    obs_id, version, urgency, n, sig_len, text_len, details_len = _OBS.unpack_from(buf, offset)
+    offset += _OBS.size
+    text = bytes(buf[offset:offset + text_len]).decode()
+    offset += text_len
+    details = json.loads(bytes(buf[offset:offset + details_len])) if details_len else None
+    offset += details_len
+    columns, offset = _unpack_columns(buf, offset, n)
+    signature = struct.unpack_from(f"<{sig_len}q", buf, offset) if sig_len else None
+    offset += 8 * sig_len
+    return (key, obs_id, version, urgency, text, details, columns, signature), offset
+
+
+class GeoJournal:
+    """
+    Thread-safe writer for the append-only journal. Records are handed to the
+    OS every flush_every writes, so they survive a process restart; fsync
+    happens on compaction and close.
+    """
+    def __init__(self, path: str, lsn: int = 0, flush_every: int = 1):
+        self.path = path
+        self.lsn = lsn
+        self.flush_every = flush_every
+        self.records_since_snapshot = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+
+    def _append(self, kind: int, payload: bytes):
+        with self._lock:
+            self.lsn += 1
+            head = _RECORD.pack(len(payload), self.lsn, kind)
+            self._file.write(head + payload + _CRC.pack(zlib.crc32(head + payload)))
+            self.records_since_snapshot += 1
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._file.flush()
+                self._pending = 0
+
+    def log_add(self, key, obs):
+        self._append(ADD, _pack_observation(key, obs))
+
+    def log_merge(self, key, target, new_obs):
+        self._append(MERGE, _KEY.pack(*key)
+                     + _MERGE.pack(target.obs_id, target.version, target.urgency, new_obs.source_count)
+                     + _pack_columns(new_obs))
+
+    def log_drop(self, key, version: int):
+        self._append(DROP, _KEY.pack(*key) + _DROP.pack(version))
+
+    def log_prune(self, key, version: int, obs_ids: Iterable[int]):
+        obs_ids = list(obs_ids)
+        self._append(PRUNE, _KEY.pack(*key) + _PRUNE.pack(version, len(obs_ids))
+                     + struct.pack(f"<{len(obs_ids)}q", *obs_ids))
+
+    def flush(self, sync: bool = False):
+        with self._lock:
+            self._file.flush()
+            self._pending = 0
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def rotate(self, rotated_path: str) -> int:
+        """
+        Move every record so far to rotated_path and continue in an empty
+        journal; returns the last LSN moved. Delete rotated_path once a
+        snapshot covering that LSN is durable. If an earlier rotation was
+        never deleted, the records are appended to it instead, so replaying
+        rotated_path and then the journal still sees every record in order.
+        """
+        with self._lock:
+            self._file.close()
+            if os.path.exists(rotated_path):
+                with open(self.path, "rb") as src, open(rotated_path, "ab") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, rotated_path)
+            self._file = open(self.path, "ab")
+            self.records_since_snapshot = 0
+            self._pending = 0
+            return self.lsn
+
+    def close(self):
+        self.flush(sync=True)
+        self._file.close()
+
+
+def read_journal(path: str, after_lsn: int = 0) -> Iterator[Tuple[int, int, Tuple[Any, ...]]]:
+    """
+    Yield (lsn, kind, fields) for records with lsn > after_lsn. A torn or
+    corrupt tail is truncated off the file once the good records are read.
+    Fields per kind:
+        ADD    (key, obs_id, version, urgency, text, details, columns, signature)
+        MERGE  (key, target_id, version, urgency, columns)
+        DROP   (key, version)
+        PRUNE  (key, version, obs_ids)
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    good_end = 0
+    try:
+        offset = 0
+        size = len(buf)
+        while offset + _RECORD.size <= size:
+            length, lsn, kind = _RECORD.unpack_from(buf, offset)
+            end = offset + _RECORD.size + length
+            if end + _CRC.size > size or \
+                    _CRC.unpack_from(buf, end)[0] != zlib.crc32(buf[offset:end]):
+                break
+            good_end = end + _CRC.size
+            if lsn > after_lsn:
+                body = offset + _RECORD.size
+                if kind == ADD:
+                    fields, _ = _unpack_observation(buf, body)
+                else:
+                    key = _KEY.unpack_from(buf, body)
+                    body += _KEY.size
+                    if kind == MERGE:
+                        target_id, version, urgency, n = _MERGE.unpack_from(buf, body)
+                        columns, _ = _unpack_columns(buf, body + _MERGE.size, n)
+                        fields = (key, target_id, version, urgency, columns)
+                    elif kind == DROP:
+                        fields = (key, _DROP.unpack_from(buf, body)[0])
+                    else:
+                        version, count = _PRUNE.unpack_from(buf, body)
+                        fields = (key, version, struct.unpack_from(f"<{count}q", buf, body + _PRUNE.size))
+                yield lsn, kind, fields
+            offset = good_end
+    finally:
+        torn = good_end < len(buf)
+        buf.close()
+    if torn:
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+
+
+def write_snapshot(path: str, lsn: int, version: int, items: Iterable[Tuple[Any, Any]], count: int):
+    """
+    Atomically write count (key, observation) pairs as a snapshot covering
+    the journal up to lsn.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_SNAPSHOT.pack(_MAGIC, lsn, version, count))
+        for key, obs in items:
+            f.write(_pack_observation(key, obs))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: str) -> Optional[Tuple[int, int, Iterator[Tuple[Any, ...]]]]:
+    """
+    Return (lsn, version, records) for a snapshot, or None if there is none.
+    records yields the same fields as an ADD journal record, straight from
+    the memory-mapped file.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, lsn, version, count = _SNAPSHOT.unpack_from(buf, 0)
+    if magic != _MAGIC:
+        buf.close()
+        raise ValueError(f"{path} is not a geo store snapshot")
+
+    def records():
+        try:
+            offset = _SNAPSHOT.size
+            for _ in range(count):
+                fields, offset = _unpack_observation(buf, offset)
+                yield fields
+        finally:
+            buf.close()
+
+    return lsn, version, records()
+
+
+def pack_shard(radius_levels, items: Iterable[Tuple[Any, Any]]) -> bytes:
+    """
+    Encode (key, observation) pairs and the store's radius levels as a shard.
+    """
+    items = list(items)
+    return b"".join([_SHARD.pack(_SHARD_MAGIC, len(radius_levels), len(items)),
+                     struct.pack(f"<{len(radius_levels)}d", *radius_levels)]
+                    + [_pack_observation(key, obs) for key, obs in items])
+
+
+def unpack_shard(buf) -> Tuple[Tuple[float, ...], Iterator[Tuple[Any, ...]]]:
+    """
+    Return (radius_levels, records) for a shard; records yields the same
+    fields as an ADD journal record.
+    """
+    magic, levels, count = _SHARD.unpack_from(buf, 0)
+    if magic != _SHARD_MAGIC:
+        raise ValueError("not a geo store shard")
+    radius_levels = struct.unpack_from(f"<{levels}d", buf, _SHARD.size)
+
+    def records():
+        offset = _SHARD.size + 8 * levels
+        for _ in range(count):
+            fields, offset = _unpack_observation(buf, offset)
+            yield fields
+
+    return radius_levels, records()
@@ -1,8 +1,31 @@
+import asyncio
+import hashlib
+import heapq
+import io
+import itertools
+import json
 import math
+import os
+import pickle
+import queue
+import random
+import re
 import threading
 import time
-from typing import List, Dict, Any, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import (List, Dict, Any, Tuple, Optional, Callable, Iterator, Iterable,
+                    AsyncIterable, AsyncIterator, Union)
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+import multiprocessing
+
+import numpy as np
+
+import geo_export
+import geo_kernels
+import geo_log
+import telemetry
 
 # Pseudocode placeholders for moondream usage
 import moondream as md
@@ -23,169 +46,2713 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+# Cells form a quadtree over lat/lon degrees: a zoom-z cell is 360 / 2**z degrees
+# on a side, and the parent of (z, x, y) is (z - 1, x >> 1, y >> 1).
+KM_PER_DEGREE = 111.32
+MAX_CELL_ZOOM = 30
+
+CellKey = Tuple[int, int, int]  # (zoom, x, y)
+
+def radius_to_zoom(radius_km: float) -> int:
+    """
+    Pick the zoom whose cell edge is closest to the diameter of radius_km.
+    """
+    edge_deg = 2 * radius_km / KM_PER_DEGREE
+    zoom = round(math.log2(360.0 / edge_deg))
+    return max(0, min(MAX_CELL_ZOOM, zoom))
+
+def cell_for(lat: float, lon: float, zoom: int) -> CellKey:
+    """
+    Return the key of the zoom-level cell containing lat/lon.
+    """
+    n = 1 << zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((lat + 90.0) / 360.0 * n)
+    return (zoom, min(max(x, 0), n - 1), min(max(y, 0), max(n // 2 - 1, 0)))
+
+def cell_parent(key: CellKey, zoom: int) -> CellKey:
+    """
+    Return the ancestor of key at a coarser (or equal) zoom.
+    """
+    z, x, y = key
+    shift = z - zoom
+    return (zoom, x >> shift, y >> shift)
+
+def cell_bounds(key: CellKey) -> Tuple[float, float, float, float]:
+    """
+    Return (min_lat, min_lon, max_lat, max_lon) of a cell.
+    """
+    z, x, y = key
+    size = 360.0 / (1 << z)
+    return (y * size - 90.0, x * size - 180.0, (y + 1) * size - 90.0, (x + 1) * size - 180.0)
+
+def cell_center(key: CellKey) -> Tuple[float, float]:
+    """
+    Return the (lat, lon) center of a cell.
+    """
+    min_lat, min_lon, max_lat, max_lon = cell_bounds(key)
+    return ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+
+def tokenize(text: str) -> frozenset:
+    """
+    Split text into the lowercase word set used by the similarity measure.
+    """
+    return frozenset(text.lower().split())
+
+def token_set_similarity(set_a: frozenset, set_b: frozenset) -> float:
+    """
+    simple_text_similarity on already tokenized inputs.
+    """
+    return len(set_a.intersection(set_b)) / (max(len(set_a), len(set_b)) + 1e-9)
+
 def simple_text_similarity(a: str, b: str) -> float:
     """
     A naive text similarity measure; replace with more advanced
     (e.g., embeddings from the moondream model) for better merging.
     """
-    set_a = set(a.lower().split())
-    set_b = set(b.lower().split())
-    return len(set_a.intersection(set_b)) / (max(len(set_a), len(set_b)) + 1e-9)
+    return token_set_similarity(tokenize(a), tokenize(b))
+
+class MinHashLSH:
+    """
+    MinHash signatures with banded LSH buckets for near-duplicate lookup.
+    More bands (fewer rows per band) find more candidates at the cost of
+    speed; verify=True re-scores candidates with the exact token similarity.
+    """
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, verify: bool = True, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.verify = verify
+        # Seeded so signatures agree across processes and restarts
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME))
+                       for _ in range(num_perm)]
+
+    @staticmethod
+    def _token_hash(token: str) -> int:
+        return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+    def signature(self, tokens: frozenset) -> Tuple[int, ...]:
+        hashes = [self._token_hash(t) for t in tokens]
+        if not hashes:
+            return (self._PRIME,) * self.num_perm
+        p = self._PRIME
+        return tuple(min((a * h + b) % p for h in hashes) for a, b in self._perms)
+
+    def band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+        r = self.rows
+        return [(band, hash(signature[band * r:(band + 1) * r])) for band in range(self.bands)]
+
+    @staticmethod
+    def estimate_similarity(sig_a: Tuple[int, ...], len_a: int,
+                            sig_b: Tuple[int, ...], len_b: int) -> float:
+        """
+        Estimate token_set_similarity from signatures: MinHash estimates the
+        Jaccard index J, and |A & B| = J * (|A| + |B|) / (1 + J).
+        """
+        j = sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+        common = j * (len_a + len_b) / (1 + j)
+        return common / (max(len_a, len_b) + 1e-9)
 
 class Observation:
     """
     Holds a single environment observation.
+    Sources are kept as parallel typed columns (time/lat/lon as float64,
+    frame_id as int64) that merges append to in place; the `sources`
+    property rebuilds the list-of-dicts view on demand.
     """
-    def __init__(self, environment: str, urgency: int, sources: List[Dict[str, Any]]):
+    __slots__ = ("environment", "urgency", "details", "signature", "times", "lats", "lons", "frame_ids",
+                 "last_seen", "version", "obs_id")
+
+    def __init__(self, environment: str, urgency: int, sources: List[Dict[str, Any]],
+                 details: Optional[Dict[str, str]] = None):
         self.environment = environment
         self.urgency = urgency
+        # Answers to any extra per-frame prompts (e.g. {"hazard": "flooding"});
+        # a merge keeps the first observation's details
+        self.details = details
+        # MinHash signature, filled in by a GeoBin that uses MinHashLSH
+        self.signature: Optional[Tuple[int, ...]] = None
         # For transparency: store all references that reported this observation
-        self.sources = sources  # e.g. [{"time":..., "lat":..., "lon":..., "frame_id":...}, ...]
+        self.times = array("d")
+        self.lats = array("d")
+        self.lons = array("d")
+        self.frame_ids = array("q")
+        # Latest source timestamp, drives time-to-live eviction
+        self.last_seen = -math.inf
+        # Store version of the last add or merge into this observation
+        self.version = 0
+        # Store-wide id, assigned when a bin first stores the observation
+        self.obs_id = 0
+        for source in sources:
+            self.add_source(source.get("time", math.nan), source["lat"], source["lon"],
+                            source.get("frame_id", -1))
+
+    @property
+    def sources(self) -> List[Dict[str, Any]]:
+        """
+        e.g. [{"time":..., "lat":..., "lon":..., "frame_id":...}, ...]
+        """
+        return [{"time": t, "lat": la, "lon": lo, "frame_id": f}
+                for t, la, lo, f in zip(self.times, self.lats, self.lons, self.frame_ids)]
+
+    @property
+    def source_count(self) -> int:
+        return len(self.frame_ids)
+
+    def add_source(self, time: float, lat: float, lon: float, frame_id: int):
+        self.times.append(time)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.frame_ids.append(frame_id)
+        if time > self.last_seen:
+            self.last_seen = time
+
+    def extend_sources(self, other: "Observation"):
+        self.times.extend(other.times)
+        self.lats.extend(other.lats)
+        self.lons.extend(other.lons)
+        self.frame_ids.extend(other.frame_ids)
+        self.last_seen = max(self.last_seen, other.last_seen)
+
+    def copy(self) -> "Observation":
+        """
+        Return an independent copy; source columns are copied, not shared.
+        """
+        clone = Observation(self.environment, self.urgency, [], self.details)
+        clone.signature = self.signature
+        clone.extend_sources(self)
+        return clone
+
+    def source_ids(self) -> List[Tuple[int, Optional[float], float, float]]:
+        """
+        (frame_id, time, lat, lon) per source, identifying a report across
+        stores; frame ids alone are only unique within one analyzer. A
+        missing (NaN) time becomes None so equal reports compare equal.
+        """
+        return [(f, t if t == t else None, la, lo)
+                for t, la, lo, f in zip(self.times, self.lats, self.lons, self.frame_ids)]
+
+    @classmethod
+    def from_record(cls, obs_id: int, version: int, urgency: int, text: str,
+                    details: Optional[Dict[str, str]], columns: Tuple[array, array, array, array],
+                    signature: Optional[Tuple[int, ...]]) -> "Observation":
+        """
+        Rebuild an observation from the fields geo_log reads back.
+        """
+        obs = cls(text, urgency, [], details)
+        obs.times, obs.lats, obs.lons, obs.frame_ids = columns
+        obs.last_seen = max((t for t in obs.times if t == t), default=-math.inf)
+        obs.signature = signature
+        obs.obs_id, obs.version = obs_id, version
+        return obs
+
+class CellAggregate:
+    """
+    Running summary of the finest-level observations under one coarser cell:
+    observation and source counts, source centroid, urgency histogram (so
+    the max survives removals) and the most-reported texts. It is updated in
+    place on every add, merge and removal below the cell, so a coarse level
+    costs a few arithmetic operations per insert rather than a merge scan.
+    """
+    __slots__ = ("count", "sources", "lat_sum", "lon_sum", "urgencies", "texts", "version")
+
+    # Distinct texts tracked per cell; beyond this the lightest is replaced
+    # (space-saving heavy hitters), so weights are approximate upper bounds
+    MAX_TEXTS = 8
+
+    def __init__(self):
+        self.count = 0
+        self.sources = 0
+        self.lat_sum = 0.0
+        self.lon_sum = 0.0
+        # urgency -> number of observations with it
+        self.urgencies: Dict[int, int] = {}
+        # text -> number of sources reporting it
+        self.texts: Dict[str, int] = {}
+        self.version = 0
+
+    @property
+    def max_urgency(self) -> int:
+        return max(self.urgencies, default=0)
+
+    @property
+    def centroid(self) -> Tuple[float, float]:
+        if not self.sources:
+            return math.nan, math.nan
+        return self.lat_sum / self.sources, self.lon_sum / self.sources
+
+    def representative_texts(self, n: Optional[int] = None) -> List[str]:
+        """
+        Tracked texts, most reported first.
+        """
+        return sorted(self.texts, key=self.texts.get, reverse=True)[:n]
+
+    def _count_urgency(self, urgency: int, delta: int):
+        n = self.urgencies.get(urgency, 0) + delta
+        if n > 0:
+            self.urgencies[urgency] = n
+        else:
+            self.urgencies.pop(urgency, None)
+
+    def _weigh_text(self, text: str, weight: int):
+        texts = self.texts
+        if text in texts:
+            texts[text] += weight
+            if texts[text] <= 0:
+                del texts[text]
+        elif weight > 0:
+            if len(texts) >= self.MAX_TEXTS:
+                lightest = min(texts, key=texts.get)
+                weight += texts.pop(lightest)
+            texts[text] = weight
+
+    def _add_sources(self, obs: Observation, sign: int):
+        self.sources += sign * obs.source_count
+        self.lat_sum += sign * math.fsum(obs.lats)
+        self.lon_sum += sign * math.fsum(obs.lons)
+
+    def add(self, obs: Observation):
+        self.count += 1
+        self._add_sources(obs, 1)
+        self._count_urgency(obs.urgency, 1)
+        self._weigh_text(str(obs.environment), obs.source_count)
+
+    def merge(self, target: Observation, new_obs: Observation, old_urgency: int):
+        """
+        Account for new_obs having been merged into target, whose urgency
+        was old_urgency before the merge.
+        """
+        self._add_sources(new_obs, 1)
+        if target.urgency != old_urgency:
+            self._count_urgency(old_urgency, -1)
+            self._count_urgency(target.urgency, 1)
+        self._weigh_text(str(target.environment), new_obs.source_count)
+
+    def remove(self, obs: Observation):
+        self.count -= 1
+        self._add_sources(obs, -1)
+        self._count_urgency(obs.urgency, -1)
+        self._weigh_text(str(obs.environment), -obs.source_count)
+
+    def copy(self) -> "CellAggregate":
+        clone = CellAggregate()
+        clone.count, clone.sources = self.count, self.sources
+        clone.lat_sum, clone.lon_sum = self.lat_sum, self.lon_sum
+        clone.urgencies, clone.texts = dict(self.urgencies), dict(self.texts)
+        clone.version = self.version
+        return clone
+
+class _UrgencyHeap:
+    """
+    Observations ordered most urgent first (newest first among equals), with
+    lazy deletion: entries for removed observations, or superseded by an
+    urgency rise, are skipped when they surface and compacted away by
+    UrgencyIndex.compact once they outnumber the live ones.
+    """
+    __slots__ = ("heap", "live", "lock", "retired", "marked", "pending")
+
+    def __init__(self):
+        self.heap: List[Tuple[int, int, Observation]] = []
+        self.live = 0
+        self.lock = threading.Lock()
+        # Set once the heap is dropped from its index; writers then retry
+        self.retired = False
+        # Set once queued for compaction, until it runs
+        self.marked = False
+        # Entries pushed while a compaction filters a copy of the heap
+        self.pending: Optional[List[Tuple[int, int, Observation]]] = None
+
+    def top(self, k: int, is_live: Callable[[Tuple[int, int, Observation]], bool]) -> List[Observation]:
+        """
+        The k most urgent live observations, in O(k log n) plus stale entries met.
+        """
+        with self.lock:
+            taken = []
+            while self.heap and len(taken) < k:
+                entry = heapq.heappop(self.heap)
+                if is_live(entry):
+                    taken.append(entry)
+            for entry in taken:
+                heapq.heappush(self.heap, entry)
+            return [entry[2] for entry in taken]
+
+class UrgencyIndex:
+    """
+    Incremental most-urgent view of a HierarchicalGeoStore: heaps over
+    everything plus one per coarse-level cell, updated as the store adds,
+    merges and removes observations, so top-k never scans the store.
+    Finest cells hold a handful of observations and are read directly.
+
+    Only stored() runs under a bin lock. Heap pushes come after it is
+    released, the whole-store heap is split into STRIPES by obs_id so
+    inserts do not queue on one lock, and stale entries are dropped by
+    compact() (called from the store's sweep and after a reload) rather
+    than on insert. Between sweeps stale entries only come from urgency
+    rises, and urgency only goes up, so they stay few.
+    """
+    STRIPES = 8
+
+    def __init__(self):
+        self._global = [_UrgencyHeap() for _ in range(self.STRIPES)]
+        self._cells: Dict[CellKey, _UrgencyHeap] = {}
+        # obs_id -> the stored Observation, for as long as it is stored
+        self._stored: Dict[int, Observation] = {}
+        # Heaps queued for compact(), by id, with their cell (None for stripes)
+        self._bloated: Dict[int, Tuple[Optional[CellKey], _UrgencyHeap]] = {}
+        self._lock = threading.Lock()
+
+    def _is_live(self, entry: Tuple[int, int, Observation]) -> bool:
+        neg_urgency, _, obs = entry
+        return self._stored.get(obs.obs_id) is obs and obs.urgency == -neg_urgency
+
+    def _mark(self, key: Optional[CellKey], heap: _UrgencyHeap):
+        # Caller holds heap.lock
+        if not heap.marked and (heap.live <= 0 or len(heap.heap) > 2 * heap.live + 64):
+            heap.marked = True
+            with self._lock:
+                self._bloated[id(heap)] = (key, heap)
+
+    def _push(self, key: Optional[CellKey], heap: _UrgencyHeap, entry: Tuple[int, int, Observation],
+              new: bool) -> bool:
+        with heap.lock:
+            if heap.retired:
+                return False
+            heapq.heappush(heap.heap, entry)
+            if heap.pending is not None:
+                heap.pending.append(entry)
+            heap.live += new
+            self._mark(key, heap)
+            return True
+
+    def stored(self, obs: Observation):
+        """
+        obs was stored; call under the bin lock so it orders with remove().
+        """
+        self._stored[obs.obs_id] = obs
+
+    def push(self, obs: Observation, urgency: int, keys: List[CellKey], new: bool):
+        """
+        Index obs at urgency, its value when it was stored (new) or raised,
+        captured under the bin lock; a later raise pushes again and leaves
+        this entry stale.
+        """
+        entry = (-urgency, -obs.obs_id, obs)
+        self._push(None, self._global[obs.obs_id % self.STRIPES], entry, new)
+        for key in keys:
+            while True:
+                heap = self._cells.get(key)
+                if heap is None:
+                    with self._lock:
+                        heap = self._cells.setdefault(key, _UrgencyHeap())
+                if self._push(key, heap, entry, new):
+                    break
+
+    def remove(self, obs: Observation, keys: List[CellKey]):
+        if self._stored.pop(obs.obs_id, None) is None:
+            return
+        stripe = self._global[obs.obs_id % self.STRIPES]
+        for key, heap in [(None, stripe)] + [(key, self._cells.get(key)) for key in keys]:
+            if heap is None:
+                continue
+            with heap.lock:
+                heap.live -= 1
+                self._mark(key, heap)
+
+    def compact(self):
+        """
+        Drop stale entries from the heaps queued since the last call and
+        retire cell heaps left empty. Each heap's lock is held only to copy
+        its entries and to swap the filtered ones in; entries pushed in
+        between are carried over.
+        """
+        with self._lock:
+            queued, self._bloated = self._bloated, {}
+        for key, heap in queued.values():
+            with heap.lock:
+                entries = list(heap.heap)
+                heap.pending = []
+            kept = [entry for entry in entries if self._is_live(entry)]
+            heapq.heapify(kept)
+            with heap.lock:
+                for entry in heap.pending:
+                    heapq.heappush(kept, entry)
+                heap.heap, heap.pending, heap.marked = kept, None, False
+                heap.live = len(kept)
+                if key is not None and not kept:
+                    # Same lock order as _mark: heap, then index
+                    heap.retired = True
+                    with self._lock:
+                        if self._cells.get(key) is heap:
+                            del self._cells[key]
+
+    def top(self, k: int, key: Optional[CellKey] = None) -> List[Observation]:
+        """
+        The k most urgent stored observations, overall or within one cell.
+        """
+        if k <= 0:
+            return []
+        if key is None:
+            found = [obs for heap in self._global for obs in heap.top(k, self._is_live)]
+            return heapq.nsmallest(k, found, key=lambda obs: (-obs.urgency, -obs.obs_id))
+        heap = self._cells.get(key)
+        return heap.top(k, self._is_live) if heap is not None else []
 
 class GeoBin:
     """
     Stores Observations in a particular geospatial bin. 
     Allows merging of similar observations.
+    An inverted token index limits merge scoring to observations that share
+    at least one word with the incoming one; with a MinHashLSH, candidates
+    come from the observations sharing an LSH band bucket instead.
     """
-    def __init__(self):
+    def __init__(self, lsh: Optional[MinHashLSH] = None,
+                 versions: Optional[Iterator[int]] = None,
+                 key: Optional[CellKey] = None, journal: Optional[geo_log.GeoJournal] = None,
+                 listener: Optional["HierarchicalGeoStore"] = None):
         # list of Observation objects
         self.observations: List[Observation] = []
+        # Token set of each observation, parallel to self.observations
+        self._tokens: List[frozenset] = []
+        # token -> indices into self.observations, in insertion order
+        self._postings: Dict[str, List[int]] = {}
+        self.lsh = lsh
+        # (band, band hash) -> indices into self.observations, when lsh is set
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        # Set once the store has dropped this bin; inserts must not land here
+        self.retired = False
+        # Version counter (shared store-wide) and the version of the last change
+        self._versions = versions if versions is not None else itertools.count(1)
+        self.version = 0
+        # Where mutations are journaled, under the bin lock so per-bin order holds
+        self.key = key
+        self.journal = journal
+        # Told about every add, merge and removal (under the bin lock), to
+        # keep coarse-level aggregates in step
+        self.listener = listener
+        # Source id -> index of the observation holding it; built by the first
+        # deduplicating insert, kept up to date after that, reset by eviction
+        self._source_owners: Optional[Dict[Tuple, int]] = None
         # Protect writes with a lock
         self.lock = threading.Lock()
 
-    def merge_or_add_observation(self, new_obs: Observation, sim_threshold: float = 0.6):
+    def _find_merge_target(self, tokens: frozenset, sim_threshold: float) -> Optional[int]:
+        """
+        Return the index of the first observation (in insertion order) whose
+        similarity to tokens reaches sim_threshold, or None. Caller holds self.lock.
+        """
+        if sim_threshold <= 0:
+            # Every pair scores >= 0, so the linear scan would stop at the first entry
+            return 0 if self.observations else None
+        # Shared-token counts are exactly the set intersections of the linear scan
+        shared: Dict[int, int] = {}
+        for token in tokens:
+            for i in self._postings.get(token, ()):
+                shared[i] = shared.get(i, 0) + 1
+        n = len(tokens)
+        target = None
+        for i, common in shared.items():
+            if (target is None or i < target) and \
+                    common / (max(n, len(self._tokens[i])) + 1e-9) >= sim_threshold:
+                target = i
+        return target
+
+    def _find_lsh_merge_target(self, tokens: frozenset, signature: Tuple[int, ...],
+                               sim_threshold: float) -> Optional[int]:
+        """
+        Like _find_merge_target, but only scores observations sharing an LSH
+        bucket, so pairs LSH misses are never merged. Caller holds self.lock.
+        """
+        candidates = set()
+        for key in self.lsh.band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+        for i in sorted(candidates):
+            if self.lsh.verify:
+                sim = token_set_similarity(self._tokens[i], tokens)
+            else:
+                sim = MinHashLSH.estimate_similarity(self.observations[i].signature,
+                                                     len(self._tokens[i]), signature, len(tokens))
+            if sim >= sim_threshold:
+                return i
+        return None
+
+    def _index(self, index: int, obs: Observation, tokens: frozenset):
+        if self.lsh is not None:
+            for key in self.lsh.band_keys(obs.signature):
+                self._buckets.setdefault(key, []).append(index)
+        else:
+            for token in tokens:
+                self._postings.setdefault(token, []).append(index)
+
+    def _dedupe_sources(self, new_obs: Observation) -> Tuple[Optional[int], Observation]:
+        """
+        Return the index of the first observation already holding one of
+        new_obs's sources (or None), and new_obs without the sources this bin
+        already holds. Caller holds self.lock.
+        """
+        owners = self._source_owners
+        if owners is None:
+            owners = self._source_owners = {}
+            for i, obs in enumerate(self.observations):
+                self._own_sources(i, obs)
+        incoming = new_obs.source_ids()
+        owner = min((owners[source] for source in incoming if source in owners), default=None)
+        if owner is None:
+            return None, new_obs
+        fresh = Observation(new_obs.environment, new_obs.urgency, [], new_obs.details)
+        fresh.signature = new_obs.signature
+        seen = set()
+        for source in incoming:
+            if source not in owners and source not in seen:
+                seen.add(source)
+                frame_id, t, lat, lon = source
+                fresh.add_source(math.nan if t is None else t, lat, lon, frame_id)
+        return owner, fresh
+
+    def _own_sources(self, index: int, obs: Observation):
+        for source in obs.source_ids():
+            self._source_owners.setdefault(source, index)
+
+    def merge_or_add_observation(self, new_obs: Observation, sim_threshold: float = 0.6,
+                                 dedupe: bool = False) -> Optional[bool]:
         """
         Merge new_obs into existing if similarity >= sim_threshold; else add new entry.
+        With dedupe (for folding in other stores' observations), an observation
+        already holding one of new_obs's sources is the target regardless of
+        similarity, and sources the bin already holds are not added again.
+        Returns True if added, False if merged, None if the bin was retired
+        and the caller should insert into a fresh bin instead.
+        """
+        tokens = tokenize(new_obs.environment)
+        if self.lsh is not None and new_obs.signature is None:
+            new_obs.signature = self.lsh.signature(tokens)
+        added, indexed = self._merge_or_add(new_obs, tokens, sim_threshold, dedupe)
+        # Store-wide bookkeeping runs after the bin lock is released
+        if added is not None and self.listener is not None:
+            self.listener.bin_touched(self.key, self)
+            if indexed is not None:
+                self.listener.urgency_changed(self.key, *indexed)
+        return added
+
+    def _merge_or_add(self, new_obs: Observation, tokens: frozenset, sim_threshold: float,
+                      dedupe: bool) -> Tuple[Optional[bool], Optional[Tuple[Observation, int, bool]]]:
+        """
+        The locked part of merge_or_add_observation. Also returns the
+        observation whose urgency the store must index, with that urgency
+        and whether it is new, or None.
         """
         with self.lock:
-            for existing in self.observations:
-                sim = simple_text_similarity(existing.environment, new_obs.environment)
-                if sim >= sim_threshold:
-                    # Merge logic: combine sources, possibly average or max urgency
-                    existing.sources.extend(new_obs.sources)
-                    existing.urgency = max(existing.urgency, new_obs.urgency)
-                    return
+            if self.retired:
+                return None, None
+            target = None
+            if dedupe:
+                target, new_obs = self._dedupe_sources(new_obs)
+                if target is not None and not new_obs.source_count \
+                        and new_obs.urgency <= self.observations[target].urgency:
+                    return False, None  # already fully known here
+            if target is None:
+                if self.lsh is not None:
+                    target = self._find_lsh_merge_target(tokens, new_obs.signature, sim_threshold)
+                else:
+                    target = self._find_merge_target(tokens, sim_threshold)
+            self.version = next(self._versions)
+            if target is not None:
+                existing = self.observations[target]
+                old_urgency = existing.urgency
+                # Merge logic: combine sources, possibly average or max urgency
+                existing.extend_sources(new_obs)
+                existing.urgency = max(existing.urgency, new_obs.urgency)
+                existing.version = self.version
+                if self._source_owners is not None:
+                    self._own_sources(target, new_obs)
+                if self.journal is not None:
+                    self.journal.log_merge(self.key, existing, new_obs)
+                if self.listener is not None:
+                    self.listener.observation_merged(self.key, existing, new_obs, old_urgency, self.version)
+                raised = existing.urgency != old_urgency
+                return False, ((existing, existing.urgency, False) if raised else None)
             # If not merged, store as a new distinct observation
-            self.observations.append(new_obs)
+            new_obs.version = new_obs.obs_id = self.version
+            self._append(new_obs, tokens)
+            if self._source_owners is not None:
+                self._own_sources(len(self.observations) - 1, new_obs)
+            if self.journal is not None:
+                self.journal.log_add(self.key, new_obs)
+            if self.listener is not None:
+                self.listener.observation_added(self.key, new_obs, self.version)
+            return True, (new_obs, new_obs.urgency, True)
+
+    def _append(self, obs: Observation, tokens: frozenset):
+        index = len(self.observations)
+        self.observations.append(obs)
+        self._tokens.append(tokens)
+        self._index(index, obs, tokens)
+
+    def restore(self, obs: Observation):
+        """
+        Append an observation recovered from a snapshot or journal as-is,
+        without merge matching.
+        """
+        tokens = tokenize(obs.environment)
+        if self.lsh is not None and obs.signature is None:
+            obs.signature = self.lsh.signature(tokens)
+        with self.lock:
+            self._append(obs, tokens)
+            self._source_owners = None
+            self.version = max(self.version, obs.version)
+            if self.listener is not None:
+                self.listener.observation_added(self.key, obs, obs.version)
+        if self.listener is not None:
+            self.listener.bin_touched(self.key, self)
+            self.listener.urgency_changed(self.key, obs, obs.urgency, True)
+
+    def evict(self, should_evict: Callable[[Observation], bool]) -> int:
+        """
+        Drop observations matching should_evict, keeping insertion order, and
+        rebuild the merge index. Returns the number removed.
+        """
+        with self.lock:
+            keep = [i for i, obs in enumerate(self.observations) if not should_evict(obs)]
+            removed = len(self.observations) - len(keep)
+            if removed:
+                self.version = next(self._versions)
+                kept = set(keep)
+                dropped = [obs for i, obs in enumerate(self.observations) if i not in kept]
+                if self.journal is not None:
+                    self.journal.log_prune(self.key, self.version, (obs.obs_id for obs in dropped))
+                if self.listener is not None:
+                    self.listener.observations_removed(self.key, dropped, self.version)
+                observations, token_sets = self.observations, self._tokens
+                self.observations, self._tokens = [], []
+                self._postings, self._buckets = {}, {}
+                self._source_owners = None
+                for index, i in enumerate(keep):
+                    self.observations.append(observations[i])
+                    self._tokens.append(token_sets[i])
+                    self._index(index, observations[i], token_sets[i])
+            return removed
+
+class SharedExclusiveLock:
+    """
+    Many holders in shared mode or one in exclusive mode. A waiting exclusive
+    holder blocks new shared holders so it cannot be starved.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive or self._exclusive_waiting:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._exclusive_waiting += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+class GeoDelta:
+    """
+    Changes returned by HierarchicalGeoStore.changes_since.
+    Apply `removed` first (forget everything held for those cells), then
+    `bins` (finest-level observations added or merged since the previous
+    version; for removed cells that still exist, their full current
+    contents) and `aggregates` (the full current summary of every coarser
+    cell that changed, replacing what was held). When `reset` is set the
+    caller fell behind the tombstone history: drop all state, `bins` and
+    `aggregates` then hold the whole store.
+    """
+    def __init__(self, version: int, bins: Dict[CellKey, List[Observation]],
+                 removed: List[CellKey], reset: bool = False,
+                 aggregates: Optional[Dict[CellKey, CellAggregate]] = None):
+        self.version = version
+        self.bins = bins
+        self.removed = removed
+        self.reset = reset
+        self.aggregates = aggregates if aggregates is not None else {}
+
+class ShardSnapshot:
+    """
+    Portable copy of one HierarchicalGeoStore's observations, keyed by
+    finest cell, so a coordinator can fold the stores of many analyzers into
+    one view without re-running inference. to_bytes()/from_bytes() move it
+    between processes; merge() combines shards the way
+    HierarchicalGeoStore.merge_shard does. Sources are never duplicated, so
+    per-cell source sets do not depend on merge order or grouping; which
+    observations end up merged follows the same greedy first-match rule as
+    live inserts, so it can differ with order just as arrival order does.
+    """
+    __slots__ = ("radius_levels", "items")
+
+    def __init__(self, radius_levels: List[float], items: List[Tuple[CellKey, Observation]]):
+        self.radius_levels = list(radius_levels)
+        self.items = items
+
+    @property
+    def source_count(self) -> int:
+        return sum(obs.source_count for _, obs in self.items)
+
+    def to_bytes(self) -> bytes:
+        return geo_log.pack_shard(self.radius_levels, self.items)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ShardSnapshot":
+        radius_levels, records = geo_log.unpack_shard(data)
+        return cls(radius_levels, [(key, Observation.from_record(*fields)) for key, *fields in records])
+
+    def merge(self, *others: "ShardSnapshot") -> "ShardSnapshot":
+        """
+        Return a new shard holding this one and others folded together in order.
+        """
+        store = HierarchicalGeoStore(radius_levels=self.radius_levels)
+        for shard in (self,) + others:
+            store.merge_shard(shard)
+        return store.shard_snapshot()
 
 class HierarchicalGeoStore:
     """
     Maintains multiple radii bins for each location.
     Example radii: 0.1 km, 1 km, 10 km, ...
+    Each radius maps to a quadtree zoom, so coarser cells are parents of finer ones
+    and memory grows with the number of occupied cells, not with GPS points.
+    Observations are stored (and merged) once, in the finest-level bin; each
+    coarser cell keeps a CellAggregate of what lies below it.
     """
-    def __init__(self, radius_levels: List[float] = [0.1, 1.0, 10.0]):
+    def __init__(self, radius_levels: List[float] = [0.1, 1.0, 10.0],
+                 lsh: Optional[MinHashLSH] = None, lock_stripes: int = 64,
+                 ttl_seconds: Optional[float] = None, urgency_ttl_factor: float = 0.5,
+                 max_observations: Optional[int] = None, sweep_batch: int = 256,
+                 max_tombstones: int = 100000, data_dir: Optional[str] = None,
+                 snapshot_every: int = 100000, flush_every: int = 1,
+                 metrics: Optional[telemetry.MetricsRegistry] = None):
         self.radius_levels = radius_levels  # in km
-        # Dictionary: key=(center_lat, center_lon, radius), value=GeoBin
-        self.bins: Dict[Tuple[float, float, float], GeoBin] = {}
-        self.lock = threading.Lock()
+        # Insert outcomes and bin churn; a private registry when none is shared
+        self.metrics = metrics if metrics is not None else telemetry.MetricsRegistry()
+        self._added = self.metrics.counter("geo.added")
+        self._merged = self.metrics.counter("geo.merged")
+        self._bins_created = self.metrics.counter("geo.bins_created")
+        self._bins_dropped = self.metrics.counter("geo.bins_dropped")
+        self._observations = self.metrics.gauge("geo.observations")
+        # Optional MinHash/LSH merge-candidate lookup shared by every bin
+        self.lsh = lsh
+        # Finest zoom first so coarser keys can be derived by shifting
+        self.zoom_levels = sorted({radius_to_zoom(r) for r in radius_levels}, reverse=True)
+        # Dictionary: key=(zoom, x, y) finest-level cell, value=GeoBin
+        self.bins: Dict[CellKey, GeoBin] = {}
+        # Coarser-level cell -> summary of the finest observations below it;
+        # updated under the cell's stripe lock
+        self.aggregates: Dict[CellKey, CellAggregate] = {}
+        # Most urgent observations, overall and per coarse-level cell
+        self.urgent = UrgencyIndex()
+        # Coarsest-level cell -> occupied finest-level cells below it, used to
+        # prune spatial queries without walking every bin
+        self._children: Dict[CellKey, set] = {}
+        # Inserts hold this shared and only serialize per cell (bin creation
+        # on a stripe lock, merges on the bin lock); readers that need a
+        # consistent view of the whole store take it exclusive
+        self.lock = SharedExclusiveLock()
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+
+        # Retention: an observation expires ttl_seconds after its latest source,
+        # extended by urgency_ttl_factor * ttl_seconds per urgency point. Past
+        # max_observations stored entries, least recently touched cells go first.
+        self.ttl_seconds = ttl_seconds
+        self.urgency_ttl_factor = urgency_ttl_factor
+        self.max_observations = max_observations
+        self.sweep_batch = sweep_batch
+        self._entries = 0
+        self._entries_lock = threading.Lock()
+        self._sweep_queue: List[CellKey] = []
+        # (last insert time, bin) by cell, least recent first, so LRU eviction
+        # reads only the oldest few; split TOUCH_STRIPES ways so inserts into
+        # different cells rarely queue on the same lock
+        self._touched: List["OrderedDict[CellKey, Tuple[float, GeoBin]]"] = \
+            [OrderedDict() for _ in range(self.TOUCH_STRIPES)]
+        self._touched_locks = [threading.Lock() for _ in range(self.TOUCH_STRIPES)]
+        self._sweep_wakeup = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = False
+
+        # Every add, merge or eviction takes the next version; changes_since
+        # diffs against it. Evicted or pruned cells leave a tombstone.
+        self._versions = itertools.count(1)
+        self.max_tombstones = max_tombstones
+        self._tombstones: Dict[CellKey, int] = {}
+        self._tombstone_floor = 0
+        self._tombstone_lock = threading.Lock()
+
+        # Durability: with a data_dir, mutations go to an append-only journal
+        # and every snapshot_every records the store is compacted into a
+        # snapshot. Existing data there is reloaded first.
+        self.data_dir = data_dir
+        self.snapshot_every = snapshot_every
+        self.journal: Optional[geo_log.GeoJournal] = None
+        self._snapshot_lock = threading.Lock()
+        if data_dir is not None:
+            os.makedirs(data_dir, exist_ok=True)
+            lsn = self._load()
+            self.journal = geo_log.GeoJournal(self._journal_path, lsn, flush_every)
+            for geo_bin in self.bins.values():
+                geo_bin.journal = self.journal
+            if os.path.exists(self._rotated_journal_path):
+                # The last compaction never finished; finish it now
+                self.snapshot()
 
-    def _get_bin_keys(self, lat: float, lon: float) -> List[Tuple[float, float, float]]:
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.data_dir, "geo_store.snap")
+
+    @property
+    def _journal_path(self) -> str:
+        return os.path.join(self.data_dir, "geo_store.log")
+
+    @property
+    def _rotated_journal_path(self) -> str:
+        # Records moved aside by a compaction until its snapshot is durable
+        return os.path.join(self.data_dir, "geo_store.log.old")
+
+    def _load(self) -> int:
         """
-        For a given lat, lon, produce a list of bin-keys that point to 
-        hierarchical radius coverage. For simplicity, we store each new lat/lon
-        as "center" for each radius in radius_levels. Alternatively, you can
-        store discrete cell centers (like geohashes).
+        Rebuild the store from the snapshot plus the journal tail after it
+        (starting in the rotated journal if a compaction was interrupted),
+        applying recorded outcomes directly. Returns the last applied LSN.
         """
-        # Here we just do (lat, lon) as center with each radius. This is one approach.
-        # Another approach is to do round lat/lon to specific increments to avoid explosion.
-        keys = []
-        for r in self.radius_levels:
-            keys.append((round(lat, 3), round(lon, 3), r))  # e.g. rounding to reduce collisions
-        return keys
+        def restore(key, *fields):
+            obs = Observation.from_record(*fields)
+            self._get_or_create_bin(key).restore(obs)
+            by_id[obs.obs_id] = obs
+
+        by_id: Dict[int, Observation] = {}
+        lsn = max_version = 0
+        snapshot = geo_log.read_snapshot(self._snapshot_path)
+        if snapshot is not None:
+            lsn, max_version, records = snapshot
+            for fields in records:
+                restore(*fields)
+
+        replay = itertools.chain.from_iterable(
+            geo_log.read_journal(path, after) for path, after in
+            ((self._rotated_journal_path, lsn), (self._journal_path, lsn)))
+        for lsn, kind, fields in replay:
+            key = fields[0]
+            version = fields[2] if kind in (geo_log.ADD, geo_log.MERGE) else fields[1]
+            max_version = max(max_version, version)
+            geo_bin = self.bins.get(key)
+            if kind == geo_log.ADD:
+                restore(*fields)
+            elif kind == geo_log.MERGE:
+                _, target_id, _, urgency, columns = fields
+                merged = Observation("", 0, [])
+                merged.times, merged.lats, merged.lons, merged.frame_ids = columns
+                merged.last_seen = max((t for t in merged.times if t == t), default=-math.inf)
+                target = by_id.get(target_id)
+                if target is None or geo_bin is None:
+                    # Journals written before drops were ordered ahead of
+                    # re-creation can merge into an observation already dropped
+                    continue
+                old_urgency = target.urgency
+                target.extend_sources(merged)
+                target.urgency, target.version = urgency, version
+                geo_bin.version = max(geo_bin.version, version)
+                self.observation_merged(key, target, merged, old_urgency, version)
+                if target.urgency != old_urgency:
+                    self.urgency_changed(key, target, target.urgency, False)
+            elif kind == geo_log.DROP:
+                if geo_bin is not None:
+                    for obs in geo_bin.observations:
+                        by_id.pop(obs.obs_id, None)
+                    self._drop_bin(key, geo_bin, only_if_empty=False)
+            elif geo_bin is not None:
+                pruned = set(fields[2])
+                geo_bin.evict(lambda obs: obs.obs_id in pruned)
+
+        # Continue numbering past everything recovered; delta consumers from
+        # before the restart fall behind the tombstone floor and resync
+        self._versions = itertools.count(max_version + 1)
+        self._tombstones.clear()
+        self._tombstone_floor = max_version + 1
+        self._entries = 0
+        for geo_bin in self.bins.values():
+            geo_bin._versions = self._versions
+            self._entries += len(geo_bin.observations)
+        self.urgent.compact()
+        return lsn
+
+    def snapshot(self):
+        """
+        Compact the journal into a new snapshot. Inserts pause only while the
+        observations are copied; serializing and fsync run after.
+        """
+        if self.journal is None:
+            raise RuntimeError("store has no data_dir")
+        with self._snapshot_lock:
+            self._write_snapshot()
+
+    def _maybe_snapshot(self):
+        # Only one inserter compacts; the others keep journaling meanwhile
+        if not self._snapshot_lock.acquire(blocking=False):
+            return
+        try:
+            if self.journal.records_since_snapshot >= self.snapshot_every:
+                self._write_snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def _write_snapshot(self):
+        with self.lock.exclusive():
+            items = []
+            for key, geo_bin in self.bins.items():
+                for obs in geo_bin.observations:
+                    clone = obs.copy()
+                    clone.obs_id, clone.version = obs.obs_id, obs.version
+                    items.append((key, clone))
+            version = next(self._versions)
+            # Records from here on go to a fresh journal; the rotated one
+            # covers exactly the state copied above
+            lsn = self.journal.rotate(self._rotated_journal_path)
+        geo_log.write_snapshot(self._snapshot_path, lsn, version, items, len(items))
+        os.remove(self._rotated_journal_path)
+
+    def close(self):
+        """
+        Stop the sweeper and flush the journal to disk.
+        """
+        self.stop_sweeper()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def _get_bin_keys(self, lat: float, lon: float) -> List[CellKey]:
+        """
+        For a given lat, lon, produce the cell keys covering it at every zoom level.
+        The finest cell is computed once; coarser ones are its ancestors.
+        """
+        finest = cell_for(lat, lon, self.zoom_levels[0])
+        return [cell_parent(finest, z) for z in self.zoom_levels]
+
+    def _coarse_keys(self, key: CellKey) -> List[CellKey]:
+        """
+        Ancestors of a finest-level cell at every coarser zoom level.
+        """
+        return [cell_parent(key, z) for z in self.zoom_levels[1:]]
+
+    def bin_touched(self, key: CellKey, geo_bin: GeoBin):
+        """
+        GeoBin callback, after the bin lock: an insert reached geo_bin.
+        """
+        stripe = hash(key) % len(self._touched)
+        with self._touched_locks[stripe]:
+            # A bin dropped since the insert must not come back (see _drop_bin)
+            if geo_bin.retired:
+                return
+            touched = self._touched[stripe]
+            touched[key] = (time.monotonic(), geo_bin)
+            touched.move_to_end(key)
+
+    def urgency_changed(self, key: CellKey, obs: Observation, urgency: int, new: bool):
+        """
+        GeoBin callback, after the bin lock: obs in finest cell key was stored
+        (new) or had its urgency raised, to urgency.
+        """
+        self.urgent.push(obs, urgency, self._coarse_keys(key), new)
+
+    def observation_added(self, key: CellKey, obs: Observation, version: int):
+        """
+        GeoBin callback: obs was stored in finest cell key.
+        """
+        coarse_keys = self._coarse_keys(key)
+        self.urgent.stored(obs)
+        for coarse_key in coarse_keys:
+            with self._stripe(coarse_key):
+                aggregate = self.aggregates.get(coarse_key)
+                if aggregate is None:
+                    aggregate = self.aggregates[coarse_key] = CellAggregate()
+                aggregate.add(obs)
+                aggregate.version = max(aggregate.version, version)
+
+    def observation_merged(self, key: CellKey, target: Observation, new_obs: Observation,
+                           old_urgency: int, version: int):
+        """
+        GeoBin callback: new_obs was merged into target in finest cell key.
+        """
+        coarse_keys = self._coarse_keys(key)
+        for coarse_key in coarse_keys:
+            with self._stripe(coarse_key):
+                aggregate = self.aggregates[coarse_key]
+                aggregate.merge(target, new_obs, old_urgency)
+                aggregate.version = max(aggregate.version, version)
+
+    def observations_removed(self, key: CellKey, observations: List[Observation], version: int):
+        """
+        GeoBin callback: observations left finest cell key. A coarse cell
+        left with nothing below it is dropped and tombstoned.
+        """
+        if not observations:
+            return
+        coarse_keys = self._coarse_keys(key)
+        for obs in observations:
+            self.urgent.remove(obs, coarse_keys)
+        for coarse_key in coarse_keys:
+            with self._stripe(coarse_key):
+                aggregate = self.aggregates[coarse_key]
+                for obs in observations:
+                    aggregate.remove(obs)
+                aggregate.version = max(aggregate.version, version)
+                emptied = aggregate.count <= 0
+                if emptied:
+                    del self.aggregates[coarse_key]
+            if emptied:
+                self._add_tombstone(coarse_key)
+
+    def _stripe(self, key: CellKey) -> threading.Lock:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _get_or_create_bin(self, key: CellKey) -> GeoBin:
+        """
+        Return the bin for finest cell key, creating it at most once even when
+        several inserts race on the same cell. Caller holds self.lock shared.
+        """
+        geo_bin = self.bins.get(key)
+        if geo_bin is not None:
+            return geo_bin
+        with self._stripe(key):
+            geo_bin = self.bins.get(key)
+            if geo_bin is None:
+                geo_bin = GeoBin(self.lsh, self._versions, key, self.journal, self)
+                self.bins[key] = geo_bin
+                created = True
+            else:
+                created = False
+        if created:
+            self._bins_created.inc()
+            coarsest_key = cell_parent(key, self.zoom_levels[-1])
+            with self._stripe(coarsest_key):
+                self._children.setdefault(coarsest_key, set()).add(key)
+        return geo_bin
 
     def add_observation(self, lat: float, lon: float, obs: Observation):
         """
-        Place the observation into each relevant bin for lat/lon across radius_levels.
-        In a more advanced system, you might find "nearby bin centers" 
-        rather than creating new ones each time.
+        Merge the observation into the finest-level bin containing lat/lon;
+        the aggregates of the coarser cells above it follow along.
+        Inserts into different cells run concurrently.
         """
-        with self.lock:
-            bin_keys = self._get_bin_keys(lat, lon)
-            for bk in bin_keys:
-                if bk not in self.bins:
-                    self.bins[bk] = GeoBin()
-                self.bins[bk].merge_or_add_observation(obs)
+        self._insert(cell_for(lat, lon, self.zoom_levels[0]), obs)
+
+    def _insert(self, key: CellKey, obs: Observation, dedupe: bool = False) -> bool:
+        with self.lock.shared():
+            added = None
+            while added is None:  # the bin was evicted under us; use a fresh one
+                added = self._get_or_create_bin(key).merge_or_add_observation(obs, dedupe=dedupe)
+        (self._added if added else self._merged).inc()
+        if added:
+            self._add_entries(1)
+        if self.journal is not None and self.journal.records_since_snapshot >= self.snapshot_every:
+            self._maybe_snapshot()
+        return added
+
+    def shard_snapshot(self) -> "ShardSnapshot":
+        """
+        Copy every observation out as a ShardSnapshot, e.g. to ship this
+        store to a coordinator that merges many of them.
+        """
+        with self.lock.exclusive():
+            items = [(key, obs.copy()) for key, geo_bin in self.bins.items() for obs in geo_bin.observations]
+        return ShardSnapshot(self.radius_levels, items)
+
+    def merge_shard(self, shard: "ShardSnapshot") -> int:
+        """
+        Fold another store's observations in, cell by cell in their original
+        order: each merges with the usual similarity rule, or into whichever
+        observation already holds one of its sources, and sources already
+        stored in the cell are skipped, so merging the same shard twice (or
+        overlapping shards of one analyzer) counts nothing twice.
+        Returns the number of observations added rather than merged.
+        """
+        if sorted({radius_to_zoom(r) for r in shard.radius_levels}, reverse=True) != self.zoom_levels:
+            raise ValueError(f"shard radius levels {list(shard.radius_levels)} do not match "
+                             f"this store's {list(self.radius_levels)}")
+        added = 0
+        for key, obs in shard.items:
+            obs = obs.copy()
+            obs.signature = None  # the shard's LSH settings may differ from ours
+            added += self._insert(key, obs, dedupe=True)
+        return added
+
+    def _add_entries(self, delta: int):
+        with self._entries_lock:
+            self._entries += delta
+            self._observations.set(self._entries)
+            over_budget = self.max_observations is not None and self._entries > self.max_observations
+        if over_budget:
+            self._sweep_wakeup.set()
+
+    @property
+    def entry_count(self) -> int:
+        """
+        Number of stored observations (each is stored once, at the finest level).
+        """
+        return self._entries
+
+    def _expired(self, obs: Observation, now: float) -> bool:
+        if obs.last_seen == -math.inf:
+            return False  # no timestamps, so TTL does not apply
+        ttl = self.ttl_seconds * (1 + self.urgency_ttl_factor * max(obs.urgency, 0))
+        return now - obs.last_seen > ttl
+
+    def _drop_bin(self, key: CellKey, geo_bin: GeoBin, only_if_empty: bool) -> int:
+        """
+        Retire a bin and unlink it from the index. Returns the number of
+        observations dropped with it.
+        """
+        with self.lock.shared(), geo_bin.lock:
+            if geo_bin.retired or (only_if_empty and geo_bin.observations):
+                return 0
+            geo_bin.retired = True
+            removed = len(geo_bin.observations)
+            stripe = hash(key) % len(self._touched)
+            with self._touched_locks[stripe]:
+                touched = self._touched[stripe]
+                if touched.get(key, (0, None))[1] is geo_bin:
+                    del touched[key]
+            # Journal the drop before unlinking, under the stripe that bin
+            # creation takes, so a fresh bin's ADD for this cell always
+            # lands after the DROP in the journal
+            with self._stripe(key):
+                version = self._add_tombstone(key)
+                if geo_bin.journal is not None:
+                    geo_bin.journal.log_drop(key, version)
+                if self.bins.get(key) is geo_bin:
+                    del self.bins[key]
+            self.observations_removed(key, geo_bin.observations, version)
+            coarsest = cell_parent(key, self.zoom_levels[-1])
+            with self._stripe(coarsest):
+                children = self._children.get(coarsest)
+                # A fresh bin may already occupy the cell; keep it indexed
+                if children is not None and key not in self.bins:
+                    children.discard(key)
+                    if not children:
+                        del self._children[coarsest]
+        self._bins_dropped.inc()
+        if removed:
+            self._add_entries(-removed)
+        return removed
+
+    def _add_tombstone(self, key: CellKey) -> int:
+        """
+        Record that key lost observations and return the tombstone's version.
+        Caller holds self.lock shared.
+        """
+        with self._tombstone_lock:
+            self._tombstones.pop(key, None)
+            version = self._tombstones[key] = next(self._versions)
+            while len(self._tombstones) > self.max_tombstones:
+                oldest = next(iter(self._tombstones))
+                self._tombstone_floor = self._tombstones.pop(oldest)
+        return version
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Run one incremental eviction step and return the number of observations
+        evicted. TTL is checked on the next sweep_batch bins in round-robin order,
+        then up to sweep_batch least recently touched cells are dropped while the
+        store is over max_observations, and the urgency index compacts heaps
+        that collected stale entries. Each bin is handled under its own lock,
+        so inserts elsewhere keep running.
+        """
+        now = time.time() if now is None else now
+        evicted = 0
+        if self.ttl_seconds is not None:
+            if not self._sweep_queue:
+                self._sweep_queue = list(self.bins.copy())
+            batch = self._sweep_queue[-self.sweep_batch:]
+            del self._sweep_queue[-self.sweep_batch:]
+            for key in batch:
+                geo_bin = self.bins.get(key)
+                if geo_bin is None:
+                    continue
+                with self.lock.shared():
+                    removed = geo_bin.evict(lambda obs: self._expired(obs, now))
+                    if removed:
+                        self._add_tombstone(key)
+                if removed:
+                    evicted += removed
+                    self._add_entries(-removed)
+                self._drop_bin(key, geo_bin, only_if_empty=True)
+
+        if self.max_observations is not None and self._entries > self.max_observations:
+            # The oldest sweep_batch cells are among each stripe's oldest
+            candidates = []
+            for lock, touched in zip(self._touched_locks, self._touched):
+                with lock:
+                    candidates += itertools.islice(touched.items(), self.sweep_batch)
+            oldest = heapq.nsmallest(self.sweep_batch, candidates, key=lambda item: item[1][0])
+            for key, (_, geo_bin) in oldest:
+                if self._entries <= self.max_observations:
+                    break
+                evicted += self._drop_bin(key, geo_bin, only_if_empty=False)
+        self.urgent.compact()
+        return evicted
+
+    def start_sweeper(self, interval: float = 1.0):
+        """
+        Sweep in a background thread every interval seconds, or immediately
+        when an insert pushes the store over max_observations.
+        """
+        if self._sweeper is not None:
+            return
+        self._sweeper_stop = False
+
+        def run():
+            while not self._sweeper_stop:
+                self._sweep_wakeup.wait(interval)
+                self._sweep_wakeup.clear()
+                if not self._sweeper_stop:
+                    self.sweep()
 
-    def query_bins(self) -> Dict[Tuple[float, float, float], List[Observation]]:
+        self._sweeper = threading.Thread(target=run, name="geo-store-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        if self._sweeper is None:
+            return
+        self._sweeper_stop = True
+        self._sweep_wakeup.set()
+        self._sweeper.join()
+        self._sweeper = None
+
+    def query_bins(self) -> Dict[CellKey, List[Observation]]:
         """
         Return a snapshot of all bin data. 
+        Inserts are paused while copying, so the snapshot is consistent across bins.
+        Coarser cells are computed here: each lists the finest-level
+        observations below it (see query_aggregates for their summaries).
         """
-        with self.lock:
+        with self.lock.exclusive():
             result = {}
             for k, geo_bin in self.bins.items():
                 # copy observations to avoid external modifications
                 with geo_bin.lock:
-                    result[k] = list(geo_bin.observations)
+                    observations = list(geo_bin.observations)
+                result[k] = observations
+                for coarse_key in self._coarse_keys(k):
+                    result.setdefault(coarse_key, []).extend(observations)
             return result
 
+    def query_aggregates(self, zoom: Optional[int] = None) -> Dict[CellKey, CellAggregate]:
+        """
+        Return copies of the coarse-cell aggregates, optionally for one zoom level.
+        """
+        with self.lock.exclusive():
+            return {k: aggregate.copy() for k, aggregate in self.aggregates.items()
+                    if zoom is None or k[0] == zoom}
+
+    def export_columns(self, path: str, texts_per_cell: int = 3):
+        """
+        Write every occupied cell, at every zoom level, as columnar arrays
+        (centroid, counts, max urgency, texts) in an .npz a map layer can
+        memory-map; see geo_export for the layout and read_columns.
+        Inserts pause while the cells are summarized.
+        """
+        with self.lock.exclusive():
+            summaries: Dict[CellKey, CellAggregate] = dict(self.aggregates)
+            for key, geo_bin in self.bins.items():
+                # Finest cells are summarized on the fly, the same way
+                aggregate = summaries[key] = CellAggregate()
+                for obs in geo_bin.observations:
+                    aggregate.add(obs)
+            rows = [(key, *summary.centroid, summary.count, summary.sources, summary.max_urgency,
+                     summary.representative_texts(texts_per_cell))
+                    for key, summary in sorted(summaries.items(), key=lambda item: (-item[0][0], item[0][1:]))]
+            version = next(self._versions)
+        geo_export.write_columns(path, rows, self.zoom_levels, version)
+
+    def top_urgent(self, k: int, region: Optional[Tuple] = None) -> List[Observation]:
+        """
+        The k most urgent observations, newest first among equal urgency.
+        region is None for the whole store, a (zoom, x, y) cell at one of the
+        store's zoom levels, or a (min_lat, min_lon, max_lat, max_lon) box, in
+        which case observations need a source inside the box. The whole store
+        and coarse cells come from an incrementally maintained index; finest
+        cells and boxes rank what those cells hold.
+        """
+        if region is None or (len(region) == 3 and region[0] != self.zoom_levels[0]):
+            return self.urgent.top(k, region)
+        if len(region) == 3:
+            geo_bin = self.bins.get(region)
+            if geo_bin is None:
+                return []
+            with geo_bin.lock:
+                candidates = list(geo_bin.observations)
+        else:
+            candidates = self.query_bbox(*region)
+        return heapq.nsmallest(k, candidates, key=lambda obs: (-obs.urgency, -obs.obs_id))
+
+    def changes_since(self, version: int = 0) -> GeoDelta:
+        """
+        Return what changed after `version` (0 = everything), plus the version
+        to pass next time. Coarse aggregates change whenever any of their
+        finest children do, so unchanged regions are skipped from the coarsest
+        level down and the cost follows the amount of change, not total history.
+        """
+        with self.lock.exclusive():
+            # No insert is in flight, so every version below this is applied
+            current = next(self._versions)
+            reset = version < self._tombstone_floor
+            since = 0 if reset else version
+            removed = [] if reset else [k for k, v in self._tombstones.items() if v > since]
+            removed_set = set(removed)
+
+            if reset:
+                changed_keys = set(self.bins)
+                changed_aggregates = set(self.aggregates)
+            else:
+                changed_keys = set()
+                changed_aggregates = set()
+                coarse = len(self.zoom_levels) > 1
+                for coarse_key, children in self._children.items():
+                    aggregate = self.aggregates.get(coarse_key)
+                    if coarse and (aggregate is None or aggregate.version <= since):
+                        continue
+                    for key in children:
+                        if self.bins[key].version > since:
+                            changed_keys.add(key)
+                            changed_aggregates.update(self._coarse_keys(key))
+                # Ancestors of evicted cells may have changed with no child left to find them by
+                for key in removed:
+                    changed_aggregates.update(cell_parent(key, z) for z in self.zoom_levels[1:] if z < key[0])
+
+            result = {}
+            for key in changed_keys:
+                geo_bin = self.bins.get(key)
+                if geo_bin is None or geo_bin.version <= since:
+                    continue
+                with geo_bin.lock:
+                    if key in removed_set:
+                        result[key] = list(geo_bin.observations)
+                    else:
+                        observations = [obs for obs in geo_bin.observations if obs.version > since]
+                        if observations:
+                            result[key] = observations
+            aggregates = {}
+            for key in changed_aggregates:
+                aggregate = self.aggregates.get(key)
+                if aggregate is not None and aggregate.version > since:
+                    aggregates[key] = aggregate.copy()
+            return GeoDelta(current, result, removed, reset, aggregates)
+
+    # Above this many finest cells, spatial queries go through the coarse index
+    MAX_DIRECT_CELLS = 256
+    # LRU recency lists; each sweep reads sweep_batch entries from every one
+    TOUCH_STRIPES = 8
+    # Observations with at least this many sources are measured with the
+    # NumPy kernel; below it the per-call overhead beats the scalar loop
+    VECTOR_MIN_SOURCES = 32
+
+    def _cells_in_bbox(self, min_lat: float, min_lon: float,
+                       max_lat: float, max_lon: float) -> List[CellKey]:
+        """
+        Return occupied finest-level cells intersecting the bounding box.
+        Caller must hold self.lock exclusive.
+        """
+        finest = self.zoom_levels[0]
+        _, x0, y0 = cell_for(min_lat, min_lon, finest)
+        _, x1, y1 = cell_for(max_lat, max_lon, finest)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= self.MAX_DIRECT_CELLS:
+            return [(finest, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+                    if (finest, x, y) in self.bins]
+
+        coarsest = self.zoom_levels[-1]
+        shift = finest - coarsest
+        cx0, cy0, cx1, cy1 = x0 >> shift, y0 >> shift, x1 >> shift, y1 >> shift
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= len(self._children):
+            parents = [self._children.get((coarsest, cx, cy), ())
+                       for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        else:
+            parents = [children for (_, cx, cy), children in self._children.items()
+                       if cx0 <= cx <= cx1 and cy0 <= cy <= cy1]
+        return [k for children in parents for k in children
+                if x0 <= k[1] <= x1 and y0 <= k[2] <= y1]
+
+    def _candidates_in_boxes(self, boxes: List[Tuple[float, float, float, float]]
+                             ) -> List[Tuple[Observation, array, array]]:
+        """
+        Collect distinct observations from the finest bins intersecting any of
+        the boxes, each with copies of its lat/lon columns taken under the bin
+        lock, since merges keep appending to the originals. Only the cell
+        lookup runs under the store lock.
+        """
+        with self.lock.exclusive():
+            keys = {k for box in boxes for k in self._cells_in_bbox(*box)}
+            geo_bins = [self.bins[k] for k in keys]
+        seen = set()
+        result = []
+        for geo_bin in geo_bins:
+            with geo_bin.lock:
+                candidates = [(obs, obs.lats[:], obs.lons[:]) for obs in geo_bin.observations
+                              if id(obs) not in seen]
+            for candidate in candidates:
+                seen.add(id(candidate[0]))
+            result += candidates
+        return result
+
+    @staticmethod
+    def _radius_boxes(lat: float, lon: float, km: float) -> List[Tuple[float, float, float, float]]:
+        """
+        Bounding boxes that together cover every point within km of lat/lon
+        (great-circle, as in haversine_distance): one box, two when the range
+        crosses the antimeridian, or a full band of longitudes when it
+        reaches a pole.
+        """
+        angle = km / geo_kernels.EARTH_RADIUS_KM
+        # A hair of slack so points exactly at km survive cell rounding
+        dlat = math.degrees(angle) + 1e-9
+        min_lat, max_lat = lat - dlat, lat + dlat
+        if angle >= math.pi or min_lat <= -90.0 or max_lat >= 90.0:
+            return [(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)]
+        # Widest longitude offset on the cap, reached north of lat, not at it
+        dlon = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(lat)), 1.0))) + 1e-9
+        west, east = lon - dlon, lon + dlon
+        if west < -180.0:
+            return [(min_lat, west + 360.0, max_lat, 180.0), (min_lat, -180.0, max_lat, east)]
+        if east > 180.0:
+            return [(min_lat, west, max_lat, 180.0), (min_lat, -180.0, max_lat, east - 360.0)]
+        return [(min_lat, west, max_lat, east)]
+
+    @staticmethod
+    def _distance_to(lats: array, lons: array, lat: float, lon: float) -> float:
+        """
+        Distance (km) from lat/lon to the closest of an observation's sources,
+        given private copies of its columns (see _candidates_in_boxes).
+        """
+        if len(lats) >= HierarchicalGeoStore.VECTOR_MIN_SOURCES:
+            # Views are safe only because nobody else holds these copies
+            return float(geo_kernels.haversine_to_many(
+                lat, lon, np.frombuffer(lats), np.frombuffer(lons)).min())
+        return min((haversine_distance(lat, lon, s_lat, s_lon)
+                    for s_lat, s_lon in zip(lats, lons)), default=math.inf)
+
+    def query_radius(self, lat: float, lon: float, km: float) -> List[Observation]:
+        """
+        Return observations with at least one source within km of lat/lon,
+        closest first.
+        """
+        hits = []
+        for obs, lats, lons in self._candidates_in_boxes(self._radius_boxes(lat, lon, km)):
+            d = self._distance_to(lats, lons, lat, lon)
+            if d <= km:
+                hits.append((d, obs))
+        hits.sort(key=lambda h: h[0])
+        return [obs for _, obs in hits]
+
+    def query_bbox(self, min_lat: float, min_lon: float,
+                   max_lat: float, max_lon: float) -> List[Observation]:
+        """
+        Return observations with at least one source inside the bounding box.
+        """
+        return [obs for obs, lats, lons in self._candidates_in_boxes([(min_lat, min_lon, max_lat, max_lon)])
+                if any(min_lat <= s_lat <= max_lat and min_lon <= s_lon <= max_lon
+                       for s_lat, s_lon in zip(lats, lons))]
+
+    def nearest_k(self, lat: float, lon: float, k: int) -> List[Tuple[float, Observation]]:
+        """
+        Return up to k (distance_km, Observation) pairs closest to lat/lon.
+        The search radius starts at one finest cell and doubles until k
+        observations fall inside it, so only nearby cells are examined.
+        """
+        if k <= 0:
+            return []
+        km = 360.0 / (1 << self.zoom_levels[0]) * KM_PER_DEGREE
+        while True:
+            hits = []
+            for obs, lats, lons in self._candidates_in_boxes(self._radius_boxes(lat, lon, km)):
+                d = self._distance_to(lats, lons, lat, lon)
+                if d <= km:
+                    hits.append((d, obs))
+            # Past half the circumference the box already covers the globe
+            if len(hits) >= k or km >= math.pi * geo_kernels.EARTH_RADIUS_KM:
+                return heapq.nsmallest(k, hits, key=lambda h: h[0])
+            km *= 2
+
+
+# What the model says about one frame: (environment, urgency, details)
+Answer = Tuple[str, int, Dict[str, str]]
+
+class EncodedImageCache:
+    """
+    Content-addressed LRU cache of encoded images, keyed by a hash of the
+    frame's bytes (and the model, since encodings are model specific).
+    Holds at most max_bytes in memory; with a disk_dir, entries are also
+    pickled there so later runs over the same footage skip encoding, with
+    the least recently used files deleted past max_disk_bytes. Files other
+    processes add to a shared disk_dir are only counted from the next start.
+    """
+    def __init__(self, max_bytes: int = 512 << 20, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 4 << 30):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        # File sizes on disk by key, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        # Recency across runs comes from mtimes, which get() refreshes
+        found = []
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".pkl"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, entry.name[:-len(".pkl")], stat.st_size))
+        for _, key, size in sorted(found):
+            self._files[key] = size
+            self._disk_bytes += size
+        self._evict_files()
+
+    def _evict_files(self):
+        # Called with the lock held (or before the cache is shared)
+        while self._disk_bytes > self.max_disk_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    @staticmethod
+    def key_for(data: bytes, model_id: str = "") -> str:
+        # blake2b keys are capped at 64 bytes; hash the namespace down to
+        # that rather than truncating it, so long model paths that share a
+        # prefix (or differ only in their @resolution suffix) stay distinct
+        namespace = hashlib.blake2b(model_id.encode(), digest_size=32).digest()
+        return hashlib.blake2b(data, digest_size=20, person=b"moondream-enc",
+                               key=namespace).hexdigest()
+
+    @staticmethod
+    def _size_of(encoded: Any) -> int:
+        # moondream's OnnxEncodedImage is dominated by its kv_cache array
+        nbytes = getattr(getattr(encoded, "kv_cache", None), "nbytes", None)
+        return nbytes if nbytes is not None else len(pickle.dumps(encoded))
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + ".pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.disk_dir is not None:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    encoded = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                self._remember(key, encoded)
+                try:
+                    os.utime(self._disk_path(key))
+                except OSError:
+                    pass
+                with self._lock:
+                    if key in self._files:
+                        self._files.move_to_end(key)
+                    self.hits += 1
+                return encoded
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, encoded: Any):
+        self._remember(key, encoded)
+        if self.disk_dir is not None and not os.path.exists(self._disk_path(key)):
+            tmp = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(encoded, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            if size > self.max_disk_bytes:
+                os.remove(tmp)
+                return
+            os.replace(tmp, self._disk_path(key))
+            with self._lock:
+                self._disk_bytes += size - self._files.pop(key, 0)
+                self._files[key] = size
+                self._evict_files()
+
+    def _remember(self, key: str, encoded: Any):
+        size = self._size_of(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (encoded, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: compare neighbouring pixels of a tiny grayscale copy.
+    Near-identical frames differ in only a few of the hash_size**2 bits.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class FrameDeduplicator:
+    """
+    Remembers the last `window` answers per frame source with each frame's
+    perceptual hash and content key. A later frame from the same source within
+    max_age seconds that is byte-identical, or whose hash is within
+    max_distance bits, reuses the answer instead of running the model.
+    """
+    def __init__(self, max_distance: int = 6, window: int = 8, max_age: float = 30.0):
+        self.max_distance = max_distance
+        self.window = window
+        self.max_age = max_age
+        self._recent: Dict[Any, deque] = {}
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.misses = 0
+
+    def matches(self, phash: Optional[int], key: Optional[str],
+                other_phash: Optional[int], other_key: Optional[str]) -> bool:
+        if key is not None and key == other_key:
+            return True
+        return phash is not None and other_phash is not None and \
+            hamming_distance(phash, other_phash) <= self.max_distance
+
+    def lookup(self, source: Any, phash: Optional[int], key: Optional[str],
+               timestamp: float) -> Optional[Answer]:
+        with self._lock:
+            for seen_hash, seen_key, seen_time, answer in reversed(self._recent.get(source, ())):
+                if abs(timestamp - seen_time) <= self.max_age and \
+                        self.matches(phash, key, seen_hash, seen_key):
+                    self.reused += 1
+                    return answer
+            self.misses += 1
+            return None
+
+    def remember(self, source: Any, phash: Optional[int], key: Optional[str],
+                 timestamp: float, answer: Answer):
+        with self._lock:
+            recent = self._recent.get(source)
+            if recent is None:
+                recent = self._recent[source] = deque(maxlen=self.window)
+            recent.append((phash, key, timestamp, answer))
+
+class FrameSampler:
+    """
+    Decides which frames are worth a model call, so model cost follows
+    distance driven rather than time recorded. Per source, a frame is
+    sampled when the camera has moved min_distance_km since the last
+    sampled frame, when max_interval seconds have passed (a parked camera
+    still reports), or, with scene_change_bits set, when its dhash differs
+    from the last sampled frame's by at least that many bits (the view
+    changed while standing still). Frames are expected in time order per
+    source.
+    """
+    def __init__(self, min_distance_km: float = 0.025, max_interval: float = 5.0,
+                 scene_change_bits: Optional[int] = None):
+        self.min_distance_km = min_distance_km
+        self.max_interval = max_interval
+        self.scene_change_bits = scene_change_bits
+        # source -> (lat, lon, time, phash) of its last sampled frame
+        self._last: Dict[Any, Tuple[float, float, float, Optional[int]]] = {}
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.skipped = 0
+
+    def should_sample(self, source: Any, lat: float, lon: float, timestamp: float,
+                      phash: Optional[int] = None) -> bool:
+        """
+        Decide for one frame and, if it is sampled, make it the reference for
+        the next. phash is only consulted when scene_change_bits is set.
+        """
+        with self._lock:
+            last = self._last.get(source)
+            sample = (
+                last is None
+                or timestamp - last[2] >= self.max_interval
+                or haversine_distance(last[0], last[1], lat, lon) >= self.min_distance_km
+                or (self.scene_change_bits is not None and phash is not None and last[3] is not None
+                    and hamming_distance(phash, last[3]) >= self.scene_change_bits)
+            )
+            if sample:
+                self._last[source] = (lat, lon, timestamp, phash)
+                self.sampled += 1
+            else:
+                self.skipped += 1
+            return sample
+
+class PreparedFrame:
+    """
+    A frame after the CPU-side stages: cache lookup, decode and perceptual hash.
+    Either `encoded` (cache hit) or `image` is set.
+    """
+    __slots__ = ("key", "image", "encoded", "phash")
+
+    def __init__(self, key: Optional[str], image: Optional[Image.Image] = None,
+                 encoded: Any = None, phash: Optional[int] = None):
+        self.key = key
+        self.image = image
+        self.encoded = encoded
+        self.phash = phash
+
+class FrameResult:
+    """
+    Outcome of one frame from iter_process_video: the (environment, urgency,
+    details) answer that was stored, or the exception that stopped the frame.
+    """
+    __slots__ = ("frame", "answer", "error")
+
+    def __init__(self, frame: Dict[str, Any], answer: Optional[Answer] = None,
+                 error: Optional[BaseException] = None):
+        self.frame = frame
+        self.answer = answer
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+_END = object()
+
+def _bounded_completion(submit: Callable[[Any], Future], items: Iterable[Any], max_pending: int,
+                        in_flight_gauge: Optional[telemetry.Gauge] = None) -> Iterator[Tuple[Any, Future]]:
+    """
+    Submit items with at most max_pending in flight, pulling the next item
+    only when one finishes, and yield (item, future) in completion order.
+    An error raised by items is re-raised once everything submitted before
+    it has been yielded.
+    """
+    items = iter(items)
+    in_flight: Dict[Future, Any] = {}
+    exhausted = False
+    failure: Optional[Exception] = None
+    while True:
+        while not exhausted and len(in_flight) < max_pending:
+            try:
+                item = next(items, _END)
+            except Exception as e:
+                # The feed broke; drain what is in flight before raising
+                failure, item = e, _END
+            if item is _END:
+                exhausted = True
+            else:
+                in_flight[submit(item)] = item
+        if not in_flight:
+            if failure is not None:
+                raise failure
+            return
+        if in_flight_gauge is not None:
+            in_flight_gauge.set(len(in_flight))
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            yield in_flight.pop(future), future
+
+def _put_until(q: "queue.Queue", item: Any, stop: threading.Event):
+    """
+    Blocking put that gives up once stop is set, so no thread stays parked
+    after the consumer has gone away.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _get_until(q: "queue.Queue", stop: threading.Event) -> Any:
+    """
+    Blocking get that returns _END once stop is set.
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _END
+
+class PipelineStage:
+    """
+    One stage of a StagedPipeline and its running counters.
+    """
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1, depth: int = 8):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.depth = depth
+        self.busy = 0.0       # seconds spent inside fn, summed over workers
+        self.processed = 0
+        self.failed = 0
+        self.max_queued = 0   # high-water mark of the input queue
+        self.lock = threading.Lock()
+
+class StagedPipeline:
+    """
+    Runs items through a chain of stages, each with its own worker threads
+    and bounded input queue. A slow stage fills its queue and blocks the
+    stage before it, so memory stays bounded and stages with different
+    resource profiles (file I/O, model compute) overlap instead of taking
+    turns. A stage function takes an item and returns it (or a replacement);
+    an item whose stage raises skips the remaining stages and comes out with
+    the error.
+    """
+    def __init__(self, stages: List[PipelineStage], metrics: Optional[telemetry.MetricsRegistry] = None):
+        self.stages = stages
+        self._depths = {stage.name: (metrics or telemetry.MetricsRegistry()).gauge(
+                            f"pipeline.{stage.name}.queue_depth") for stage in stages}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def _work(self, stage: PipelineStage, inbox: "queue.Queue", outbox: "queue.Queue",
+              remaining: List[int], stop: threading.Event):
+        while True:
+            entry = _get_until(inbox, stop)
+            if entry is _END:
+                # Let sibling workers see the end too; the last one out passes it on
+                _put_until(inbox, _END, stop)
+                with stage.lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    _put_until(outbox, _END, stop)
+                return
+            item, error = entry
+            # qsize is approximate, which is fine for a high-water mark
+            queued = inbox.qsize() + 1
+            self._depths[stage.name].set(queued)
+            stage.max_queued = max(stage.max_queued, queued)
+            if error is None:
+                start = time.perf_counter()
+                try:
+                    item = stage.fn(item)
+                except Exception as e:
+                    error = e
+                elapsed = time.perf_counter() - start
+                with stage.lock:
+                    stage.busy += elapsed
+                    stage.processed += 1
+                    stage.failed += error is not None
+            _put_until(outbox, (item, error), stop)
+
+    def run(self, items: Iterable[Any]) -> Iterator[Tuple[Any, Optional[BaseException]]]:
+        """
+        Feed items through every stage and yield (item, error) in completion
+        order. Closing the iterator early stops all stage threads.
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=stage.depth) for stage in self.stages]
+        queues.append(queue.Queue(maxsize=self.stages[-1].depth))
+        failure: List[BaseException] = []
+
+        def feed():
+            try:
+                for item in items:
+                    _put_until(queues[0], (item, None), stop)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                _put_until(queues[0], _END, stop)
+
+        self.started, self.finished = time.perf_counter(), None
+        for stage in self.stages:
+            stage.busy, stage.processed, stage.failed, stage.max_queued = 0.0, 0, 0, 0
+        threading.Thread(target=feed, daemon=True).start()
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                threading.Thread(target=self._work, args=(stage, queues[i], queues[i + 1], remaining, stop),
+                                 daemon=True).start()
+        try:
+            while True:
+                entry = _get_until(queues[-1], stop)
+                if entry is _END:
+                    break
+                yield entry
+            if failure:
+                raise failure[0]
+        finally:
+            self.finished = time.perf_counter()
+            stop.set()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-stage counters for the current or last run. utilization is the
+        share of the stage's worker time spent busy; the stage closest to 1.0
+        is the bottleneck, and adding workers there is what speeds the run up.
+        """
+        if self.started is None:
+            return {}
+        wall = (self.finished or time.perf_counter()) - self.started
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "depth": stage.depth,
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "busy_seconds": stage.busy,
+                "utilization": stage.busy / (stage.workers * wall) if wall > 0 else 0.0,
+                "max_queued": stage.max_queued,
+            }
+            for stage in self.stages
+        }
+
+    def report(self) -> str:
+        lines = [f"{'stage':<8} {'workers':>7} {'depth':>5} {'items':>7} {'busy s':>8} {'util':>6} {'max q':>5}"]
+        for name, st in self.stats().items():
+            lines.append(f"{name:<8} {st['workers']:>7} {st['depth']:>5} {st['processed']:>7} "
+                         f"{st['busy_seconds']:>8.2f} {st['utilization']:>6.0%} {st['max_queued']:>5}")
+        return "\n".join(lines)
+
+class _FrameJob:
+    """
+    A frame's state as it moves through the frame pipeline stages.
+    """
+    __slots__ = ("frame", "prepared", "encoded", "answer")
+
+    def __init__(self, frame: Dict[str, Any]):
+        self.frame = frame
+        self.prepared: Optional[PreparedFrame] = None
+        self.encoded: Any = None
+        self.answer: Optional[Answer] = None
+
+# Longest side frames are decoded to by default. moondream works on 378px
+# crops and tiles larger images at most 2x2, so detail beyond 2 * 378 is
+# downsampled away inside encode_image anyway.
+MODEL_INPUT_SIDE = 2 * 378
+
+# Execution backends accepted by process_video / iter_process_video
+_BACKENDS = ("thread", "process", "pipeline")
+
+
+def reduced_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """
+    size scaled down (never up) so its longest side is max_side.
+    """
+    width, height = size
+    scale = max_side / max(width, height)
+    if scale >= 1:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+# Default per-frame question: one free-text description
+DEFAULT_PROMPTS = {"environment": "Concisely describe what is in this image?"}
+
+# Structured questions for road hazards; all of them reuse the frame's one encoding
+HAZARD_PROMPTS = {
+    "environment": "Concisely describe what is in this image?",
+    "hazard": "What road hazard is visible (flooding, debris, fire, crash, construction or none)? "
+              "Answer in one or two words.",
+    "urgency": "On a scale of 1 to 5, how urgent is the hazard in this image? Answer with one number.",
+    "blocked_lane": "Is a traffic lane blocked? Answer no, or name the blocked lane.",
+}
+
+def parse_answer(text: str) -> str:
+    """
+    Model answers are usually plain text but sometimes JSON (a string, or an
+    object with an "answer" field); normalize either to a string.
+    """
+    text = text.strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(value, dict):
+        value = value.get("answer", value.get("environment", value))
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+
+def parse_urgency(text: str, default: int = 3) -> int:
+    """
+    First number in an answer, clamped to the 1-5 urgency scale.
+    """
+    match = re.search(r"\d+", text)
+    return min(max(int(match.group()), 1), 5) if match else default
 
 class VideoAnalyzer:
     """
     Coordinates the ingestion of a video stream, calling moondream on each frame,
     extracting environment info, and updating the HierarchicalGeoStore.
     """
-    def __init__(self, model_path: str = "moondream-0_5b-int8.mf"):
+    def __init__(self, model_path: str = "moondream-0_5b-int8.mf",
+                 cache_bytes: int = 512 << 20, cache_dir: Optional[str] = None,
+                 cache_disk_bytes: int = 4 << 30,
+                 dedup_distance: Optional[int] = 6, dedup_max_age: float = 30.0,
+                 prompts: Optional[Dict[str, str]] = None, concurrent_prompts: bool = False,
+                 metrics: Optional[telemetry.MetricsRegistry] = None,
+                 sampler: Optional[FrameSampler] = None,
+                 decode_max_side: Optional[int] = MODEL_INPUT_SIDE):
         self.model = md.vl(model=model_path)
-        self.geo_store = HierarchicalGeoStore()
+        self.model_path = model_path
+        # Frames are decoded straight to about model resolution; None keeps
+        # the source resolution
+        self.decode_max_side = decode_max_side
+        # Encodings depend on the decoded resolution as well as the model
+        self._cache_namespace = model_path if decode_max_side is None else f"{model_path}@{decode_max_side}"
+        # Stage latencies, queue depths and store counters; dump with
+        # self.metrics.to_json() or serve self.metrics.to_prometheus()
+        self.metrics = metrics if metrics is not None else telemetry.MetricsRegistry()
+        self._latency = {stage: self.metrics.histogram(f"frame.{stage}_seconds")
+                         for stage in ("decode", "encode", "query", "parse", "store")}
+        self._in_flight = self.metrics.gauge("frame.in_flight")
+        self.geo_store = HierarchicalGeoStore(metrics=self.metrics)
+        # Kept so process-pool workers can build an identically configured analyzer
+        self._worker_args = dict(model_path=model_path, cache_bytes=cache_bytes, cache_dir=cache_dir,
+                                 cache_disk_bytes=cache_disk_bytes,
+                                 dedup_distance=dedup_distance, dedup_max_age=dedup_max_age,
+                                 prompts=prompts, concurrent_prompts=concurrent_prompts,
+                                 decode_max_side=decode_max_side)
+        # Questions asked of every frame, by result field. "environment" is the
+        # description used for merging, "urgency" is parsed as 1-5, and any
+        # other answers go to Observation.details.
+        self.prompts = prompts or DEFAULT_PROMPTS
+        self._prompt_pool = ThreadPoolExecutor(max_workers=len(self.prompts)) \
+            if concurrent_prompts and len(self.prompts) > 1 else None
+        # Identical frames (e.g. stopped at a light) reuse their encoding
+        self.encode_cache = EncodedImageCache(cache_bytes, cache_dir, cache_disk_bytes) \
+            if cache_bytes or cache_dir else None
+        # Near-identical frames from the same source reuse the previous answer
+        self.dedup = FrameDeduplicator(dedup_distance, max_age=dedup_max_age) \
+            if dedup_distance is not None else None
+        # Optional policy that drops frames before any decode or model call
+        self.sampler = sampler
+        self._sampled = self.metrics.counter("frame.sampled")
+        self._skipped = self.metrics.counter("frame.skipped")
 
-    def process_frame(self, frame_id: int, image_path: str, lat: float, lon: float, timestamp: float):
+    def _load_image(self, image_source: Any) -> Image.Image:
         """
-        Process a single frame: 
-        1) Use MoonDream to get environment data 
-        2) Create an Observation 
-        3) Insert into geo_store
+        Open and fully decode a frame (path or file object), so decoding cost
+        is paid here rather than lazily inside the model call.
+
+        With decode_max_side set, JPEG frames are decoded at a reduced DCT
+        scale (draft) no smaller than the target, and the result is then
+        thumbnailed to it (which uses reduce() first for other formats), so
+        decode time and memory follow model resolution, not source size.
+        """
+        image = Image.open(image_source)
+        if self.decode_max_side is not None:
+            target = reduced_size(image.size, self.decode_max_side)
+            if target != image.size:
+                image.draft("RGB", target)
+                image = image.convert("RGB")
+                image.thumbnail(target, Image.BICUBIC, reducing_gap=2.0)
+                return image
+        return image.convert("RGB")
+
+    def _prepare_frame(self, image_path: str) -> PreparedFrame:
         """
-        # Load image
-        image = Image.open(image_path)
-        encoded_image = self.model.encode_image(image)
+        Look the frame's bytes up in the encode cache and, on a miss, decode it
+        and compute its perceptual hash.
+        """
+        with self._latency["decode"].time():
+            return self._read_frame(image_path)
 
-        # Example query for environment-only analysis
-        # You can adapt the prompt as needed to exclude personal data
-        prompt = """Describe what you see in JSON { "answer": <response> }. keep concise."""
+    def _scene_hash(self, image_path: str) -> int:
+        """
+        dhash of a frame for the sampler, from a reduced decode: JPEG frames
+        are decoded at 1/8 scale or less, since the hash only needs 9x8 pixels.
+        """
+        with Image.open(image_path) as image:
+            image.draft("L", (64, 64))
+            return dhash(image)
 
-        response = self.model.query(encoded_image, "Concisely describe what is in this image?")
-        print("ANSWER: ", response)
-        ans = response["answer"]  # e.g. a JSON string or direct dict
+    def _keep_frame(self, f: Dict[str, Any]) -> bool:
+        """
+        Ask the sampler about a frame. A frame whose image cannot be read for
+        the scene check is kept, so the error is reported downstream.
+        """
+        phash = None
+        if self.sampler.scene_change_bits is not None:
+            try:
+                phash = self._scene_hash(f["path"])
+            except OSError:
+                return True
+        keep = self.sampler.should_sample(f.get("source", "default"), f["lat"], f["lon"], f["time"], phash)
+        (self._sampled if keep else self._skipped).inc()
+        return keep
 
-        # Suppose you parse the JSON
-        # e.g. ans = '{"environment": "Flooded street", "urgency": 4}'
-        # Use a simple approach to parse the JSON. (Pseudo-code, adapt as needed)
-        import json
-        parsed = json.loads(ans)
+    def _sample(self, frames: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        if self.sampler is None:
+            return frames
+        return (f for f in frames if self._keep_frame(f))
 
-        print("PARSED: ", parsed)
+    def _read_frame(self, image_path: str) -> PreparedFrame:
+        key = None
+        if self.encode_cache is not None:
+            with open(image_path, "rb") as f:
+                data = f.read()
+            key = EncodedImageCache.key_for(data, self._cache_namespace)
+            encoded = self.encode_cache.get(key)
+            if encoded is not None:
+                return PreparedFrame(key, encoded=encoded)
+            image = self._load_image(io.BytesIO(data))
+        else:
+            image = self._load_image(image_path)
+        return PreparedFrame(key, image=image, phash=dhash(image) if self.dedup is not None else None)
 
+    def _encode_batch(self, images: List[Image.Image]) -> List[Any]:
+        """
+        Encode a batch of images. moondream's encode_image takes one image at
+        a time, so calls are issued back to back on this thread; this is the
+        single place to swap in a batched encoder.
+        """
+        encoded = []
+        for image in images:
+            with self._latency["encode"].time():
+                encoded.append(self.model.encode_image(image))
+        return encoded
+
+    def _encode_prepared(self, prepared: List[PreparedFrame]) -> List[Any]:
+        """
+        Encode the prepared frames that missed the cache (each distinct frame
+        once) and return encodings in input order.
+        """
+        pending: Dict[Any, Image.Image] = {}
+        for i, p in enumerate(prepared):
+            if p.encoded is None:
+                pending.setdefault(p.key if p.key is not None else i, p.image)
+        encoded = dict(zip(pending, self._encode_batch(list(pending.values()))))
+        if self.encode_cache is not None:
+            for key, encoded_image in encoded.items():
+                self.encode_cache.put(key, encoded_image)
+        return [p.encoded if p.encoded is not None else encoded[p.key if p.key is not None else i]
+                for i, p in enumerate(prepared)]
+
+    def ask(self, encoded_image: Any, prompts: Dict[str, str],
+            concurrent: Optional[bool] = None) -> Dict[str, str]:
+        """
+        Ask several questions about one encoded frame, reusing the encoding
+        for each; returns {name: answer text}. concurrent runs the queries on
+        a thread pool (default: the analyzer's concurrent_prompts setting).
+        """
+        if concurrent is None:
+            concurrent = self._prompt_pool is not None
+        def ask_one(question: str) -> str:
+            with self._latency["query"].time():
+                return self.model.query(encoded_image, question)["answer"]
+
+        if not concurrent or len(prompts) < 2:
+            return {name: ask_one(question) for name, question in prompts.items()}
+        if self._prompt_pool is not None:
+            return dict(zip(prompts, self._prompt_pool.map(ask_one, prompts.values())))
+        with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+            return dict(zip(prompts, pool.map(ask_one, prompts.values())))
+
+    def _describe(self, encoded_image: Any) -> Answer:
+        """
+        Ask the configured prompts about an encoded frame and fold the answers
+        into (environment, urgency, details).
+        """
+        answers = self.ask(encoded_image, self.prompts)
+        with self._latency["parse"].time():
+            parsed = {name: parse_answer(text) for name, text in answers.items()}
+            environment = parsed.pop("environment", "")
+            urgency = parse_urgency(parsed.pop("urgency")) if "urgency" in parsed else 3
+        return environment, urgency, parsed
+
+    def _store(self, answer: Answer, frame_id: int, lat: float, lon: float, timestamp: float):
+        environment, urgency, details = answer
         # Build the Observation
         new_observation = Observation(
-            environment=parsed,
-            urgency=3,
-            sources=[{"time": timestamp, "lat": lat, "lon": lon, "frame_id": frame_id}]
+            environment=environment,
+            urgency=urgency,
+            sources=[{"time": timestamp, "lat": lat, "lon": lon, "frame_id": frame_id}],
+            details=dict(details) if details else None
         )
 
-        print("NEW OBSERVATION: ", new_observation)
-
         # Store it
-        self.geo_store.add_observation(lat, lon, new_observation)
+        with self._latency["store"].time():
+            self.geo_store.add_observation(lat, lon, new_observation)
 
-    def process_video(self, frames: List[Dict[str, Any]], max_workers: int = 4):
+    def _answer_frames(self, frames: List[Dict[str, Any]],
+                       prepared: List[PreparedFrame]) -> List[Answer]:
+        """
+        Answer prepared frames, in order. Frames that duplicate a recent frame
+        from the same source (or an earlier one in this batch) reuse its
+        answer; only the rest are encoded and queried.
+        """
+        answers: List[Optional[Answer]] = [None] * len(frames)
+        leaders: List[int] = []
+        follows: Dict[int, int] = {}
+        for i, (f, p) in enumerate(zip(frames, prepared)):
+            if self.dedup is not None:
+                source = f.get("source", "default")
+                answers[i] = self.dedup.lookup(source, p.phash, p.key, f["time"])
+                if answers[i] is not None:
+                    continue
+                leader = next((j for j in reversed(leaders)
+                               if frames[j].get("source", "default") == source
+                               and abs(f["time"] - frames[j]["time"]) <= self.dedup.max_age
+                               and self.dedup.matches(p.phash, p.key, prepared[j].phash, prepared[j].key)),
+                              None)
+                if leader is not None:
+                    follows[i] = leader
+                    continue
+            leaders.append(i)
+
+        encoded = self._encode_prepared([prepared[i] for i in leaders])
+        for i, encoded_image in zip(leaders, encoded):
+            answers[i] = self._describe(encoded_image)
+            if self.dedup is not None:
+                self.dedup.remember(frames[i].get("source", "default"), prepared[i].phash,
+                                    prepared[i].key, frames[i]["time"], answers[i])
+        return [answers[follows.get(i, i)] for i in range(len(frames))]
+
+    def _run_frames(self, frames: List[Dict[str, Any]], prepared: List[PreparedFrame]):
+        for f, answer in zip(frames, self._answer_frames(frames, prepared)):
+            self._store(answer, f["frame_id"], f["lat"], f["lon"], f["time"])
+
+    def _store_result(self, frame: Dict[str, Any], answer: Answer) -> FrameResult:
+        try:
+            self._store(answer, frame["frame_id"], frame["lat"], frame["lon"], frame["time"])
+        except Exception as e:
+            return FrameResult(frame, answer, e)
+        return FrameResult(frame, answer)
+
+    def _answer_frame(self, frame: Dict[str, Any]) -> Answer:
+        return self._answer_frames([frame], [self._prepare_frame(frame["path"])])[0]
+
+    def _finish_batch(self, batch: List[Dict[str, Any]], decoding: List[Future]) -> List[FrameResult]:
+        """
+        Answer and store a batch whose frames are being decoded by `decoding`.
+        A frame that fails to decode fails alone; a failed model call fails
+        every frame still in the batch.
+        """
+        results: List[FrameResult] = []
+        frames: List[Dict[str, Any]] = []
+        prepared: List[PreparedFrame] = []
+        for f, d in zip(batch, decoding):
+            try:
+                prepared.append(d.result())
+                frames.append(f)
+            except Exception as e:
+                results.append(FrameResult(f, error=e))
+        if frames:
+            try:
+                answers = self._answer_frames(frames, prepared)
+            except Exception as e:
+                results.extend(FrameResult(f, error=e) for f in frames)
+            else:
+                results.extend(self._store_result(f, a) for f, a in zip(frames, answers))
+        return results
+
+    def process_frame(self, frame_id: int, image_path: str, lat: float, lon: float, timestamp: float,
+                      source: Any = "default"):
+        """
+        Process a single frame: 
+        1) Use MoonDream to get environment data 
+        2) Create an Observation 
+        3) Insert into geo_store
+        A frame nearly identical to a recent one from the same source skips
+        step 1 and reuses that frame's answer. Returns False, without doing
+        any of that, if the analyzer's sampler drops the frame.
         """
-        frames: list of dict like {"frame_id": int, "path": str, "lat": float, "lon": float, "time": float}
+        frame = {"frame_id": frame_id, "path": image_path, "lat": lat, "lon": lon,
+                 "time": timestamp, "source": source}
+        if self.sampler is not None and not self._keep_frame(frame):
+            return False
+        # Load image (or reuse the encoding of an identical frame)
+        self._run_frames([frame], [self._prepare_frame(image_path)])
+        return True
+
+    @staticmethod
+    def _micro_batches(frames, batch_size: int, max_wait: float,
+                       depth: Optional[telemetry.Gauge] = None):
+        """
+        Group frames into lists of up to batch_size. A frame source that
+        stalls (e.g. a live feed) flushes a partial batch after max_wait seconds.
+        An error raised by frames is re-raised here after the frames read
+        before it are yielded; closing the generator early stops the reader.
+        """
+        pending: "queue.Queue" = queue.Queue(maxsize=batch_size * 2)
+        stop = threading.Event()
+        failure: List[BaseException] = []
+
+        def produce():
+            try:
+                for f in frames:
+                    _put_until(pending, f, stop)
+                    if stop.is_set():
+                        return
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                _put_until(pending, _END, stop)
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                f = pending.get()
+                if f is _END:
+                    break
+                if depth is not None:
+                    depth.set(pending.qsize() + 1)
+                batch = [f]
+                deadline = time.monotonic() + max_wait
+                ended = False
+                while len(batch) < batch_size:
+                    try:
+                        f = pending.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if f is _END:
+                        ended = True
+                        break
+                    batch.append(f)
+                yield batch
+                if ended:
+                    break
+            if failure:
+                raise failure[0]
+        finally:
+            stop.set()
+
+    def process_video(self, frames: Iterable[Dict[str, Any]], max_workers: int = 4,
+                      batch_size: int = 1, max_batch_wait: float = 0.05,
+                      backend: str = "thread") -> List[FrameResult]:
+        """
+        frames: iterable of dict like {"frame_id": int, "path": str, "lat": float, "lon": float, "time": float}
+        and optionally "source" (camera id) for near-duplicate detection.
         Process them in parallel for maximum throughput.
+
+        With batch_size > 1, frames are micro-batched: each batch is decoded on
+        max_workers threads while the previous batch is in the model, and model
+        calls run one batch at a time instead of competing for the same cores.
+
+        backend="process" runs decode and inference in max_workers processes
+        (sidestepping the GIL); see _iter_in_processes. backend="pipeline"
+        runs decode, encode, query and store as separate stages with
+        max_workers decoders (one frame at a time, so batch_size must be 1);
+        see frame_pipeline.
+
+        Returns the results of the frames that failed; see iter_process_video
+        to consume results as they complete.
+        """
+        return [r for r in self.iter_process_video(frames, max_workers, batch_size, max_batch_wait, backend)
+                if not r.ok]
+
+    def iter_process_video(self, frames: Iterable[Dict[str, Any]], max_workers: int = 4,
+                           batch_size: int = 1, max_batch_wait: float = 0.05,
+                           backend: str = "thread", max_pending: Optional[int] = None) -> Iterator[FrameResult]:
+        """
+        Streaming form of process_video. frames can be any iterable, e.g. a
+        generator over a multi-hour video: it is read only as fast as frames
+        complete, with at most max_pending frames (default 2 * max_workers)
+        in flight, or one batch decoding ahead when micro-batching. With
+        backend="process", max_pending counts chunks of batch_size frames, so
+        up to max_pending * batch_size frames are in flight. Yields a
+        FrameResult per frame in completion order; a failing frame is
+        yielded with its error instead of stopping the run. If frames itself
+        raises, the frames read before the error are finished and yielded,
+        then the error propagates. Frames dropped by the analyzer's sampler
+        yield nothing (see the frame.skipped counter).
+
+        Raises ValueError for an unknown backend, or for batch_size > 1 with
+        backend="pipeline", whose stages take one frame at a time.
+        """
+        if backend not in _BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}; expected one of {', '.join(_BACKENDS)}")
+        if backend == "pipeline" and batch_size > 1:
+            raise ValueError("backend='pipeline' does not micro-batch; use batch_size=1")
+        max_pending = max_pending or 2 * max_workers
+        if backend == "pipeline":
+            yield from self.run_pipeline(frames, self.frame_pipeline(decode=(max_workers, max_pending)))
+            return
+        frames = self._sample(frames)
+        if backend == "process":
+            yield from self._iter_in_processes(frames, max_workers, max(batch_size, 1), max_pending)
+            return
+        if batch_size <= 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                submit = lambda f: executor.submit(self._answer_frame, f)
+                for f, future in _bounded_completion(submit, frames, max_pending, self._in_flight):
+                    error = future.exception()
+                    yield FrameResult(f, error=error) if error is not None \
+                        else self._store_result(f, future.result())
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as decoder:
+            previous = None
+            error = None
+            batches = self._micro_batches(frames, batch_size, max_batch_wait,
+                                          self.metrics.gauge("batch.queue_depth"))
+            try:
+                while True:
+                    try:
+                        batch = next(batches)
+                    except StopIteration:
+                        break
+                    except Exception as e:
+                        # The feed broke; finish what was read before raising
+                        error = e
+                        break
+                    decoding = (batch, [decoder.submit(self._prepare_frame, f["path"]) for f in batch])
+                    if previous is not None:
+                        yield from self._finish_batch(*previous)
+                    previous = decoding
+                if previous is not None:
+                    yield from self._finish_batch(*previous)
+            finally:
+                batches.close()
+            if error is not None:
+                raise error
+
+    async def aprocess_video(self, frames: Union[AsyncIterable[Dict[str, Any]], Iterable[Dict[str, Any]]],
+                             max_workers: int = 4, batch_size: int = 1, max_batch_wait: float = 0.05,
+                             backend: str = "thread", max_pending: Optional[int] = None,
+                             max_queue: int = 64) -> AsyncIterator[FrameResult]:
+        """
+        Async form of iter_process_video, for frames arriving from an async
+        iterator (e.g. a live feed). Frames and results cross to and from the
+        worker thread through queues of max_queue items, so the feed is only
+        awaited as fast as frames are processed and results are consumed.
+        """
+        loop = asyncio.get_running_loop()
+        inbox: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        outbox: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        stop = threading.Event()
+        failure: List[BaseException] = []
+
+        def incoming() -> Iterator[Dict[str, Any]]:
+            return iter(lambda: _get_until(inbox, stop), _END)
+
+        def work():
+            try:
+                for result in self.iter_process_video(incoming(), max_workers, batch_size,
+                                                      max_batch_wait, backend, max_pending):
+                    _put_until(outbox, result, stop)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                _put_until(outbox, _END, stop)
+
+        async def feed():
+            try:
+                if hasattr(frames, "__aiter__"):
+                    async for f in frames:
+                        await loop.run_in_executor(None, _put_until, inbox, f, stop)
+                else:
+                    for f in frames:
+                        await loop.run_in_executor(None, _put_until, inbox, f, stop)
+            finally:
+                await loop.run_in_executor(None, _put_until, inbox, _END, stop)
+
+        threading.Thread(target=work, daemon=True).start()
+        feeder = asyncio.ensure_future(feed())
+        try:
+            while True:
+                result = await loop.run_in_executor(None, _get_until, outbox, stop)
+                if result is _END:
+                    break
+                yield result
+            await feeder
+            if failure:
+                raise failure[0]
+        finally:
+            stop.set()
+            feeder.cancel()
+
+    def _decode_stage(self, job: _FrameJob) -> _FrameJob:
+        job.prepared = self._prepare_frame(job.frame["path"])
+        return job
+
+    def _encode_stage(self, job: _FrameJob) -> _FrameJob:
+        f, p = job.frame, job.prepared
+        if self.dedup is not None:
+            job.answer = self.dedup.lookup(f.get("source", "default"), p.phash, p.key, f["time"])
+        if job.answer is None:
+            job.encoded = self._encode_prepared([p])[0]
+        p.image = None  # the decoded pixels are not needed past this stage
+        return job
+
+    def _query_stage(self, job: _FrameJob) -> _FrameJob:
+        if job.answer is None:
+            job.answer = self._describe(job.encoded)
+            job.encoded = None
+            if self.dedup is not None:
+                f, p = job.frame, job.prepared
+                self.dedup.remember(f.get("source", "default"), p.phash, p.key, f["time"], job.answer)
+        return job
+
+    def _store_stage(self, job: _FrameJob) -> _FrameJob:
+        f = job.frame
+        self._store(job.answer, f["frame_id"], f["lat"], f["lon"], f["time"])
+        return job
+
+    def frame_pipeline(self, decode: Tuple[int, int] = (4, 16), encode: Tuple[int, int] = (1, 4),
+                       query: Tuple[int, int] = (1, 4), store: Tuple[int, int] = (1, 16)) -> StagedPipeline:
+        """
+        Build a decode -> encode -> query -> store pipeline; each argument is
+        (worker threads, input queue depth) for that stage. Reuse the returned
+        pipeline with run_pipeline and read pipeline.stats() / report() to see
+        which stage is the bottleneck.
+
+        Near-duplicate frames are caught against frames that have finished
+        the query stage, so a duplicate that arrives while its original is
+        still in flight is queried again.
+        """
+        return StagedPipeline([
+            PipelineStage("decode", self._decode_stage, *decode),
+            PipelineStage("encode", self._encode_stage, *encode),
+            PipelineStage("query", self._query_stage, *query),
+            PipelineStage("store", self._store_stage, *store),
+        ], self.metrics)
+
+    def run_pipeline(self, frames: Iterable[Dict[str, Any]],
+                     pipeline: Optional[StagedPipeline] = None) -> Iterator[FrameResult]:
+        """
+        Stream frames through a staged pipeline (frame_pipeline() defaults if
+        none is given), yielding a FrameResult per frame as it completes.
+        """
+        pipeline = pipeline or self.frame_pipeline()
+        for job, error in pipeline.run(_FrameJob(f) for f in self._sample(frames)):
+            yield FrameResult(job.frame, job.answer, error)
+
+    def _iter_in_processes(self, frames: Iterable[Dict[str, Any]], max_workers: int,
+                           chunk_size: int, max_pending: int) -> Iterator[FrameResult]:
+        """
+        Each worker process loads the model once and answers frames by path;
+        answers come back here and are inserted into geo_store. Decode,
+        encode and query timings stay in the workers' own registries; only
+        store timings and store counters land in self.metrics. Consecutive
+        frames go to the same worker in chunks of chunk_size, so its
+        near-duplicate gate still sees neighbouring frames.
         """
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for f in frames:
-                executor.submit(
-                    self.process_frame,
-                    f["frame_id"], f["path"], f["lat"], f["lon"], f["time"]
-                )
+        def chunks():
+            chunk = []
+            try:
+                for f in frames:
+                    chunk.append(f)
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+            except Exception:
+                # Frames read before a feed error still get answered
+                if chunk:
+                    yield chunk
+                raise
+            if chunk:
+                yield chunk
 
-    def get_geo_snapshot(self) -> Dict[Tuple[float, float, float], List[Observation]]:
+        # spawn, not fork: forking a process that already runs ONNX and
+        # store threads can deadlock the children
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(self._worker_args,)) as pool:
+            submit = lambda chunk: pool.submit(_answer_in_worker, chunk)
+            in_flight = self.metrics.gauge("process.chunks_in_flight")
+            for chunk, future in _bounded_completion(submit, chunks(), max_pending, in_flight):
+                error = future.exception()
+                if error is not None:
+                    yield from (FrameResult(f, error=error) for f in chunk)
+                    continue
+                for f, (answer, error) in zip(chunk, future.result()):
+                    yield FrameResult(f, error=error) if error is not None else self._store_result(f, answer)
+
+    def get_geo_snapshot(self) -> Dict[CellKey, List[Observation]]:
         """
         Get a snapshot of the entire hierarchical store.
-        Keys are (lat, lon, radius), and each value is a list of Observations.
+        Keys are (zoom, x, y) cells (see cell_center / cell_bounds), and each
+        value is a list of Observations.
         """
         return self.geo_store.query_bins()
 
+    def get_geo_changes(self, since_version: int = 0) -> GeoDelta:
+        """
+        Get only what changed in the store after since_version; pass the
+        returned delta's version on the next call.
+        """
+        return self.geo_store.changes_since(since_version)
+
+    def export_geo_columns(self, path: str, texts_per_cell: int = 3):
+        """
+        Write the store as a columnar .npz for map rendering; read it back
+        with geo_export.read_columns.
+        """
+        self.geo_store.export_columns(path, texts_per_cell)
+
+    def get_shard_snapshot(self) -> ShardSnapshot:
+        """
+        Get this analyzer's store as a ShardSnapshot, to merge with other
+        analyzers' (see HierarchicalGeoStore.merge_shard).
+        """
+        return self.geo_store.shard_snapshot()
+
+    def get_top_urgent(self, k: int = 10, region: Optional[Tuple] = None) -> List[Observation]:
+        """
+        Get the k most urgent observations, overall or within a cell or
+        (min_lat, min_lon, max_lat, max_lon) box; see HierarchicalGeoStore.top_urgent.
+        """
+        return self.geo_store.top_urgent(k, region)
+
+# Per-process analyzer used by the process-pool backend
+_worker_analyzer: Optional[VideoAnalyzer] = None
+
+def _init_worker(analyzer_kwargs: Dict[str, Any]):
+    global _worker_analyzer
+    _worker_analyzer = VideoAnalyzer(**analyzer_kwargs)
+
+def _answer_in_worker(frames: List[Dict[str, Any]]) -> List[Tuple[Optional[Answer], Optional[BaseException]]]:
+    """
+    Answer a chunk of frames in order, as (answer, error) pairs.
+    """
+    results = []
+    for frame in frames:
+        try:
+            results.append((_worker_analyzer._answer_frame(frame), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
 # -----------------------------------------------------------------------
 # EXAMPLE USAGE
 # -----------------------------------------------------------------------
@@ -207,9 +2774,11 @@ if __name__ == "__main__":
 
     # Example: print out the stored observations
     for key, observations in aggregated_data.items():
-        print(f"Bin center/radius: {key}")
+        print(f"Bin cell: {key}, center: {cell_center(key)}")
         for obs in observations:
-            print(f"  Environment: {obs.environment}, Urgency: {obs.urgency}, #Sources: {len(obs.sources)}")
+            print(f"  Environment: {obs.environment}, Urgency: {obs.urgency}, #Sources: {obs.source_count}")
+            if obs.details:
+                print(f"  Details: {obs.details}")
             # Each source is a record of where & when we saw it
             for s in obs.sources:
                 print(f"    -> {s}")
@@ -0,0 +1,220 @@
+"""
+In-process metrics for VideoAnalyzer and HierarchicalGeoStore.
+
+A MetricsRegistry holds named counters, gauges and latency histograms.
+Recording is a lock plus a few arithmetic operations (histograms bucket by
+a bisect over fixed log-spaced bounds), cheap enough to leave on under load.
+Read it back with snapshot() (a dict, e.g. for a status endpoint),
+to_json() / dump_json(), or to_prometheus() for a scraper.
+
+Names are dotted, e.g. "frame.encode_seconds" or "geo.merged"; Prometheus
+output swaps the dots for underscores.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Histogram bucket upper bounds in seconds: 1us doubling up to ~35 minutes
+DEFAULT_BOUNDS = tuple(1e-6 * 2 ** i for i in range(32))
+
+
+class Counter:
+    """
+    Monotonic count of events.
+    """
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: int = 1):
+        with self._lock:
+            self.value += n
+
+
+class Gauge:
+    """
+    Last value set (e.g. a queue depth), plus the highest value seen.
+    """
+    __slots__ = ("value", "max")
+
+    def __init__(self):
+        self.value = 0.0
+        self.max = 0.0
+
+    def set(self, value: float):
+        # Plain attribute stores are atomic; a racing max update can at
+        # worst keep the slightly smaller of two concurrent values
+        self.value = value
+        if value > self.max:
+            self.max = value
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets; bucket i counts
+    values <= bounds[i] (and above the previous bound), with a final
+    overflow bucket.
+    """
+    __slots__ = ("bounds", "buckets", "count", "sum", "min", "max", "_lock")
+
+    def __init__(self, bounds: tuple = DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.buckets[i] += 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def time(self) -> _Timer:
+        """
+        Context manager that observes the seconds spent inside it.
+        """
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the q-quantile as the upper bound of the bucket holding it
+        (at most 2x high with the default bounds), capped at the largest value.
+        """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for i, n in enumerate(self.buckets):
+                seen += n
+                if seen >= rank and n:
+                    return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+            return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self.count, self.sum
+            low, high = self.min, self.max
+            buckets = list(self.buckets)
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "min": low if count else 0.0,
+            "max": high if count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if i == len(self.bounds) else repr(self.bounds[i])): n
+                        for i, n in enumerate(buckets) if n},
+        }
+
+
+class MetricsRegistry:
+    """
+    Get-or-create home for named metrics. Look a metric up once and keep
+    the object on hot paths; the lookup itself takes a lock.
+    """
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, table: Dict[str, Any], name: str, factory) -> Any:
+        metric = table.get(name)
+        if metric is None:
+            with self._lock:
+                metric = table.get(name)
+                if metric is None:
+                    metric = table[name] = factory()
+        return metric
+
+    def counter(self, name: str) -> Counter:
+        return self._get(self._counters, name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self._get(self._gauges, name, Gauge)
+
+    def histogram(self, name: str, bounds: tuple = DEFAULT_BOUNDS) -> Histogram:
+        return self._get(self._histograms, name, lambda: Histogram(bounds))
+
+    def timer(self, name: str) -> _Timer:
+        return self.histogram(name).time()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = dict(self._histograms)
+        return {
+            "counters": {name: c.value for name, c in sorted(counters.items())},
+            "gauges": {name: {"value": g.value, "max": g.max} for name, g in sorted(gauges.items())},
+            "histograms": {name: h.snapshot() for name, h in sorted(histograms.items())},
+        }
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def dump_json(self, path: str):
+        """
+        Write the snapshot to path atomically, for a file-based scraper.
+        """
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_json(indent=2))
+        os.replace(tmp, path)
+
+    def to_prometheus(self) -> str:
+        """
+        Prometheus text exposition of every metric.
+        """
+        snap = self.snapshot()
+        lines: List[str] = []
+        for name, value in snap["counters"].items():
+            name = name.replace(".", "_")
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        for name, g in snap["gauges"].items():
+            name = name.replace(".", "_")
+            lines += [f"# TYPE {name} gauge", f"{name} {g['value']}", f"{name}_max {g['max']}"]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for name, h in histograms:
+            name = name.replace(".", "_")
+            with h._lock:
+                buckets, count, total = list(h.buckets), h.count, h.sum
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(h.bounds, buckets):
+                cumulative += n
+                lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines += [f'{name}_bucket{{le="+Inf"}} {count}', f"{name}_sum {total}", f"{name}_count {count}"]
+        return "\n".join(lines) + "\n"
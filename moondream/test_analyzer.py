@@ -0,0 +1,207 @@
+"""
+Tests for VideoAnalyzer's frame handling, with the moondream model replaced
+by FakeModel so they run without model weights. Frames are small solid-colour
+images written to a temporary directory.
+
+    python -m pytest test_analyzer.py
+"""
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+import main
+from main import FrameSampler, VideoAnalyzer
+
+RED = (255, 0, 0)
+
+
+class FakeModel:
+    """
+    Encodes an image as its top-left pixel and answers with it; encoding a
+    red image fails. Counts model calls.
+    """
+    def __init__(self):
+        self.encodes = 0
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def encode_image(self, image):
+        with self._lock:
+            self.encodes += 1
+        pixel = image.getpixel((0, 0))
+        if pixel == RED:
+            raise ValueError("model failed on a red frame")
+        return pixel
+
+    def query(self, encoded, question):
+        with self._lock:
+            self.queries += 1
+        return {"answer": "scene %d %d %d" % encoded}
+
+
+class AnalyzerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.model = FakeModel()
+        patcher = mock.patch.object(main.md, "vl", return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def image(self, name, color):
+        path = os.path.join(self.dir, name)
+        Image.new("RGB", (32, 32), color).save(path)
+        return path
+
+    def gradient(self, name, corner=0, flip=False):
+        # A horizontal ramp (dhash-distinct from its mirror image) whose
+        # top-left pixel, and so FakeModel's answer, is set by corner
+        image = Image.new("RGB", (64, 64))
+        for x in range(64):
+            v = 255 - x * 4 if flip else x * 4
+            for y in range(64):
+                image.putpixel((x, y), (v, v, v))
+        image.putpixel((0, 0), (corner, corner, corner))
+        path = os.path.join(self.dir, name)
+        image.save(path)
+        return path
+
+    def frame(self, frame_id, path, t=None, lat=37.0, lon=-122.0, source="cam"):
+        return {"frame_id": frame_id, "path": path, "lat": lat, "lon": lon,
+                "time": float(frame_id if t is None else t), "source": source}
+
+
+class FrameErrorTest(AnalyzerTestCase):
+    def frames(self):
+        frames = [self.frame(i, self.image(f"{i}.png", (i * 20, i * 20, i * 20))) for i in range(6)]
+        frames.append(self.frame(6, os.path.join(self.dir, "missing.png")))
+        frames.append(self.frame(7, self.image("red.png", RED)))
+        return frames
+
+    def test_failing_frames_are_yielded_with_their_error(self):
+        analyzer = VideoAnalyzer(cache_bytes=0, dedup_distance=None)
+        results = {r.frame["frame_id"]: r for r in analyzer.iter_process_video(self.frames(), max_workers=2)}
+        self.assertEqual(sorted(results), list(range(8)))
+        self.assertIsInstance(results[6].error, OSError)
+        self.assertIsInstance(results[7].error, ValueError)
+        for i in range(6):
+            self.assertTrue(results[i].ok)
+            self.assertEqual(results[i].answer[0], "scene %d %d %d" % ((i * 20,) * 3))
+        self.assertEqual(analyzer.geo_store.entry_count, 6)
+        self.assertEqual(sorted(r.frame["frame_id"] for r in analyzer.process_video(self.frames())), [6, 7])
+
+    def test_decode_error_fails_alone_in_a_micro_batch(self):
+        analyzer = VideoAnalyzer(cache_bytes=0, dedup_distance=None)
+        frames = self.frames()[:7]
+        results = {r.frame["frame_id"]: r for r in analyzer.iter_process_video(frames, batch_size=4)}
+        self.assertEqual([i for i, r in sorted(results.items()) if not r.ok], [6])
+
+    def test_feed_error_raises_after_frames_read_before_it(self):
+        frames = self.frames()[:5]
+
+        def feed():
+            yield from frames
+            raise RuntimeError("feed lost")
+
+        for batch_size in (1, 3):
+            with self.subTest(batch_size=batch_size):
+                analyzer = VideoAnalyzer(cache_bytes=0, dedup_distance=None)
+                results = []
+                with self.assertRaisesRegex(RuntimeError, "feed lost"):
+                    for r in analyzer.iter_process_video(feed(), max_workers=2, batch_size=batch_size,
+                                                         max_pending=2):
+                        results.append(r)
+                self.assertEqual(sorted(r.frame["frame_id"] for r in results), list(range(5)))
+                self.assertTrue(all(r.ok for r in results))
+                self.assertEqual(analyzer.geo_store.entry_count, 5)
+
+
+class DedupTest(AnalyzerTestCase):
+    def test_near_duplicates_reuse_the_answer(self):
+        analyzer = VideoAnalyzer(cache_bytes=0, dedup_distance=6, dedup_max_age=30.0)
+        first = self.gradient("first.png", corner=1)
+        # Differs from first in one pixel: same dhash, but its own answer if queried
+        near = self.gradient("near.png", corner=2)
+        other = self.gradient("other.png", corner=3, flip=True)
+        frames = [self.frame(0, first, t=0.0),
+                  self.frame(1, near, t=5.0),                    # reused
+                  self.frame(2, near, t=6.0, source="cam2"),     # other source: queried
+                  self.frame(3, other, t=7.0),                   # different scene: queried
+                  self.frame(4, near, t=100.0)]                  # too old to match: queried
+        # One frame at a time, so each sees the answers remembered before it
+        results = {r.frame["frame_id"]: r.answer[0]
+                   for r in analyzer.iter_process_video(frames, max_workers=1, max_pending=1)}
+        self.assertEqual(results, {0: "scene 1 1 1", 1: "scene 1 1 1", 2: "scene 2 2 2",
+                                   3: "scene 3 3 3", 4: "scene 2 2 2"})
+        self.assertEqual(self.model.encodes, 4)
+        self.assertEqual((analyzer.dedup.reused, analyzer.dedup.misses), (1, 4))
+
+    def test_duplicates_within_a_batch_share_one_call(self):
+        analyzer = VideoAnalyzer(cache_bytes=0, dedup_distance=6)
+        first = self.gradient("first.png", corner=1)
+        near = self.gradient("near.png", corner=2)
+        frames = [self.frame(0, first), self.frame(1, near), self.frame(2, near, source="cam2")]
+        results = {r.frame["frame_id"]: r for r in analyzer.iter_process_video(frames, batch_size=3,
+                                                                               max_batch_wait=1.0)}
+        self.assertEqual(self.model.encodes, 2)
+        self.assertEqual(results[1].answer, results[0].answer)
+        self.assertEqual(results[0].answer[0], "scene 1 1 1")
+        self.assertEqual(results[2].answer[0], "scene 2 2 2")
+
+
+class SamplerTest(AnalyzerTestCase):
+    # About 11 m and 33 m of latitude
+    STEP, MOVE = 0.0001, 0.0003
+
+    def test_distance_and_interval_decisions(self):
+        sampler = FrameSampler(min_distance_km=0.025, max_interval=5.0)
+        lat = 37.0
+        decisions = [sampler.should_sample("cam", lat, -122.0, 0.0),                    # first frame
+                     sampler.should_sample("cam", lat + self.STEP, -122.0, 1.0),        # 11 m
+                     sampler.should_sample("cam", lat + 2 * self.STEP, -122.0, 2.0),    # 22 m
+                     sampler.should_sample("cam", lat + self.MOVE, -122.0, 3.0),        # 33 m
+                     sampler.should_sample("cam", lat + self.MOVE, -122.0, 7.9),        # parked
+                     sampler.should_sample("cam", lat + self.MOVE, -122.0, 8.0),        # 5 s since last
+                     sampler.should_sample("cam2", lat + self.MOVE, -122.0, 8.5)]       # own reference
+        self.assertEqual(decisions, [True, False, False, True, False, True, True])
+        self.assertEqual((sampler.sampled, sampler.skipped), (4, 3))
+
+    def test_scene_change_decisions(self):
+        sampler = FrameSampler(max_interval=60.0, scene_change_bits=10)
+        decisions = [sampler.should_sample("cam", 37.0, -122.0, 0.0, phash=0),
+                     sampler.should_sample("cam", 37.0, -122.0, 1.0, phash=0b111111111),   # 9 bits
+                     sampler.should_sample("cam", 37.0, -122.0, 2.0, phash=0b1111111111),  # 10 bits
+                     sampler.should_sample("cam", 37.0, -122.0, 3.0, phash=None),
+                     sampler.should_sample("cam", 37.0, -122.0, 4.0, phash=0b1111111111)]
+        self.assertEqual(decisions, [True, False, True, False, False])
+        # Without scene_change_bits the hash is ignored
+        sampler = FrameSampler(max_interval=60.0)
+        self.assertEqual([sampler.should_sample("cam", 37.0, -122.0, 0.0, phash=0),
+                          sampler.should_sample("cam", 37.0, -122.0, 1.0, phash=0xffff)], [True, False])
+
+    def test_analyzer_skips_frames_before_the_model(self):
+        analyzer = VideoAnalyzer(cache_bytes=0, dedup_distance=None,
+                                 sampler=FrameSampler(min_distance_km=0.025, max_interval=5.0,
+                                                      scene_change_bits=10))
+        ramp = self.gradient("ramp.png", corner=1)
+        mirrored = self.gradient("mirrored.png", corner=2, flip=True)
+        frames = [self.frame(0, ramp, t=0.0),
+                  self.frame(1, ramp, t=1.0),                                    # parked
+                  self.frame(2, mirrored, t=2.0),                                # scene changed
+                  self.frame(3, ramp, t=3.0, lat=37.0 + self.MOVE),              # moved
+                  self.frame(4, os.path.join(self.dir, "missing.png"), t=3.5)]   # unreadable: kept
+        results = {r.frame["frame_id"]: r for r in analyzer.iter_process_video(frames, max_workers=2)}
+        self.assertEqual(sorted(results), [0, 2, 3, 4])
+        self.assertIsInstance(results[4].error, OSError)
+        self.assertEqual(self.model.encodes, 3)
+        self.assertEqual((analyzer.metrics.counter("frame.sampled").value,
+                          analyzer.metrics.counter("frame.skipped").value), (3, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
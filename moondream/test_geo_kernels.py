@@ -0,0 +1,83 @@
+"""
+Tests for the NumPy kernels in geo_kernels against scalar references:
+haversine_distance from main.py, and a per-point great-circle bearing.
+
+    python -m pytest test_geo_kernels.py
+"""
+import math
+import unittest
+
+import numpy as np
+
+from geo_kernels import (EARTH_RADIUS_KM, bearing_to_many, equirectangular_to_many, haversine_matrix,
+                         haversine_matrix_chunks, haversine_to_many)
+from main import haversine_distance
+
+
+def scalar_bearing(lat1, lon1, lat2, lon2):
+    lat1, lat2, dlon = math.radians(lat1), math.radians(lat2), math.radians(lon2 - lon1)
+    y = math.sin(dlon) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+
+class KernelTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(25)
+        # Anywhere on Earth, including across the antimeridian and near the poles
+        self.lats = np.concatenate([rng.uniform(-90, 90, 300), [89.99, -89.99, 0.0, 10.0]])
+        self.lons = np.concatenate([rng.uniform(-180, 180, 300), [0.0, 45.0, 179.999, -179.999]])
+        # Short range, where the store's queries work
+        self.near_lats = 60.0 + rng.uniform(-0.1, 0.1, 300)
+        self.near_lons = 20.0 + rng.uniform(-0.2, 0.2, 300)
+
+    def test_haversine_to_many_matches_scalar(self):
+        for lat, lon in [(37.7, -122.4), (-89.5, 10.0), (0.0, 180.0)]:
+            got = haversine_to_many(lat, lon, self.lats, self.lons)
+            want = [haversine_distance(lat, lon, a, b) for a, b in zip(self.lats, self.lons)]
+            np.testing.assert_allclose(got, want, rtol=1e-9, atol=1e-9)
+
+    def test_matrix_chunks_cover_every_pair(self):
+        lats2, lons2 = self.lats[:40], self.lons[:40]
+        want = np.array([[haversine_distance(a, b, c, d) for c, d in zip(lats2, lons2)]
+                         for a, b in zip(self.lats, self.lons)])
+        # A tiny max_bytes forces one row per block
+        rows = []
+        for start, block in haversine_matrix_chunks(self.lats, self.lons, lats2, lons2, max_bytes=1):
+            self.assertEqual(start, len(rows))
+            rows.extend(block)
+        np.testing.assert_allclose(np.array(rows), want, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(haversine_matrix(self.lats, self.lons, lats2, lons2, max_bytes=4096),
+                                   want, rtol=1e-9, atol=1e-9)
+        self.assertEqual(haversine_matrix(self.lats, self.lons, lats2, lons2, dtype=np.float32).dtype,
+                         np.float32)
+
+    def test_equirectangular_within_max_rel_error(self):
+        for lats, lons, origin in [(self.near_lats, self.near_lons, (60.0, 20.0)),
+                                   (self.lats, self.lons, (37.7, -122.4)),
+                                   (self.lats, self.lons, (89.9, 0.0))]:
+            for max_rel_error in (1e-4, 1e-7):
+                got = equirectangular_to_many(*origin, lats, lons, max_rel_error=max_rel_error)
+                want = np.array([haversine_distance(*origin, a, b) for a, b in zip(lats, lons)])
+                # Absolute slack for coincident points, where the relative error is undefined
+                self.assertTrue(np.all(np.abs(got - want) <= max_rel_error * want + 1e-9),
+                                (origin, max_rel_error))
+        self.assertEqual(len(equirectangular_to_many(0.0, 0.0, [], [])), 0)
+
+    def test_bearing_matches_scalar(self):
+        got = bearing_to_many(37.7, -122.4, self.lats, self.lons)
+        want = [scalar_bearing(37.7, -122.4, a, b) for a, b in zip(self.lats, self.lons)]
+        # Compare on the circle so 359.9999 and 0.0 agree
+        diff = (np.asarray(got) - want + 180.0) % 360.0 - 180.0
+        self.assertLess(np.abs(diff).max(), 1e-9)
+        self.assertTrue(np.all((got >= 0) & (got < 360)))
+        np.testing.assert_allclose(bearing_to_many(0.0, 0.0, [1.0, 0.0, -1.0, 0.0], [0.0, 1.0, 0.0, -1.0]),
+                                   [0.0, 90.0, 180.0, 270.0], atol=1e-9)
+
+    def test_earth_radius_matches_scalar(self):
+        # Half the circumference along the equator
+        self.assertAlmostEqual(haversine_distance(0.0, 0.0, 0.0, 180.0), math.pi * EARTH_RADIUS_KM, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
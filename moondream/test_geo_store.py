@@ -0,0 +1,459 @@
+"""
+Tests for HierarchicalGeoStore against brute-force answers.
+
+RandomRun feeds a store random adds and sweeps (with TTL, an entry budget
+and several zoom layouts picked per run); the tests check what the store
+maintains incrementally against answers recomputed from its finest bins.
+
+    python -m pytest test_geo_store.py
+"""
+import collections
+import math
+import random
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import geo_log
+from main import (CellAggregate, GeoBin, HierarchicalGeoStore, KM_PER_DEGREE, MinHashLSH, Observation, cell_bounds,
+                  cell_for, haversine_distance, simple_text_similarity)
+
+TEXTS = ["fallen tree", "flooded street", "car on fire", "debris on road"]
+
+
+def observation(text, urgency, lat, lon, t, frame_id):
+    return Observation(text, urgency, [{"time": t, "lat": lat, "lon": lon, "frame_id": frame_id}])
+
+
+def finest_bins(store):
+    return {key: obs for key, obs in store.query_bins().items() if key[0] == store.zoom_levels[0]}
+
+
+def distinct_observations(store):
+    return [o for obs in finest_bins(store).values() for o in obs]
+
+
+def snapshot(store):
+    return {key: sorted((o.obs_id, o.environment, o.urgency, list(o.frame_ids), list(o.lats), list(o.lons))
+                        for o in obs)
+            for key, obs in store.query_bins().items()}
+
+
+def brute_distance(o, lat, lon):
+    return min(haversine_distance(lat, lon, s_lat, s_lon) for s_lat, s_lon in zip(o.lats, o.lons))
+
+
+class RandomRun:
+    """
+    A store with randomly picked retention and zoom settings, advanced by
+    random adds (85%) and sweeps around a 0.3 degree square.
+    """
+    def __init__(self, rng, data_dir=None):
+        self.rng = rng
+        self.options = dict(ttl_seconds=rng.choice([None, 20.0, 80.0]),
+                            max_observations=rng.choice([None, 60, 200]),
+                            sweep_batch=rng.choice([3, 50]),
+                            radius_levels=rng.choice([[0.1, 1.0, 10.0], [0.1], [1.0, 50.0]]),
+                            data_dir=data_dir, snapshot_every=rng.choice([40, 100000]))
+        self.store = HierarchicalGeoStore(**self.options)
+        self.step = 0
+
+    def point(self):
+        return 37.7 + self.rng.random() * 0.3, -122.5 + self.rng.random() * 0.3
+
+    def advance(self, steps):
+        for _ in range(steps):
+            self.step += 1
+            if self.rng.random() < 0.85:
+                lat, lon = self.point()
+                self.store.add_observation(lat, lon, observation(
+                    self.rng.choice(TEXTS), self.rng.randint(1, 5), lat, lon, float(self.step), self.step))
+            else:
+                self.store.sweep(now=float(self.step))
+
+    def reopen(self):
+        self.store.close()
+        self.store = HierarchicalGeoStore(**self.options)
+
+    def close(self):
+        self.store.close()
+
+
+class RadiusQueryTest(unittest.TestCase):
+    def check_nearby(self, store, rng):
+        everything = distinct_observations(store)
+        for _ in range(3):
+            lat, lon = 37.7 + rng.random() * 0.3, -122.5 + rng.random() * 0.3
+            km = rng.choice([0.5, 2.0, 10.0])
+            want = sorted((brute_distance(o, lat, lon), o.obs_id) for o in everything)
+            got = store.query_radius(lat, lon, km)
+            self.assertEqual({o.obs_id for o in got}, {i for d, i in want if d <= km})
+            distances = [brute_distance(o, lat, lon) for o in got]
+            self.assertEqual(distances, sorted(distances))
+            nearest = store.nearest_k(lat, lon, 5)
+            self.assertEqual(len(nearest), min(5, len(everything)))
+            for (d, o), (want_d, _) in zip(nearest, want):
+                self.assertAlmostEqual(d, want_d, places=9)
+                self.assertAlmostEqual(d, brute_distance(o, lat, lon), places=9)
+            box = (lat - 0.05, lon - 0.05, lat + 0.05, lon + 0.05)
+            self.assertEqual({o.obs_id for o in store.query_bbox(*box)},
+                             {o.obs_id for o in everything
+                              if any(box[0] <= a <= box[2] and box[1] <= b <= box[3]
+                                     for a, b in zip(o.lats, o.lons))})
+
+    def test_matches_brute_force(self):
+        rng = random.Random(2)
+        for trial in range(8):
+            with self.subTest(trial=trial):
+                run = RandomRun(rng)
+                for _ in range(5):
+                    run.advance(60)
+                    if run.store.entry_count:
+                        self.check_nearby(run.store, rng)
+
+    def test_just_past_a_cell_boundary(self):
+        # A radius box sized with KM_PER_DEGREE falls about 0.1% short of
+        # haversine_distance's Earth, enough to skip the next row of cells
+        store = HierarchicalGeoStore()
+        finest = store.zoom_levels[0]
+        km = 8 * 360.0 / (1 << finest) * KM_PER_DEGREE
+        lat = cell_bounds(cell_for(37.0, -122.0, finest))[2] - km / KM_PER_DEGREE - 1e-6
+        north = lat + math.degrees(0.9995 * km / 6371.0)
+        south = lat - math.degrees(0.9998 * km / 6371.0)
+        store.add_observation(north, -122.0, observation("pothole", 2, north, -122.0, 0.0, 0))
+        store.add_observation(south, -122.0, observation("fallen tree", 2, south, -122.0, 1.0, 1))
+
+        self.assertEqual([o.environment for o in store.query_radius(lat, -122.0, km)],
+                         ["pothole", "fallen tree"])
+        (d, nearest), = store.nearest_k(lat, -122.0, 1)
+        self.assertEqual(nearest.environment, "pothole")
+        self.assertAlmostEqual(d, 0.9995 * km, places=9)
+
+    def test_wraps_antimeridian_and_poles(self):
+        for (lat, lon), (o_lat, o_lon) in [((10.0, 179.999), (10.0, -179.999)),
+                                           ((-10.0, -179.999), (-10.0, 179.999)),
+                                           ((89.999, 0.0), (89.999, 180.0)),
+                                           ((-89.99, 10.0), (-89.99, -170.0)),
+                                           ((60.0, 20.0), (60.009, 20.0181))]:
+            with self.subTest(query=(lat, lon)):
+                store = HierarchicalGeoStore()
+                store.add_observation(o_lat, o_lon, observation("pothole", 2, o_lat, o_lon, 0.0, 0))
+                km = haversine_distance(lat, lon, o_lat, o_lon) * 1.001
+                self.assertEqual(len(store.query_radius(lat, lon, km)), 1)
+                self.assertEqual(len(store.nearest_k(lat, lon, 1)), 1)
+                self.assertEqual(store.query_radius(lat, lon, km * 0.99), [])
+
+    def test_queries_run_while_sources_are_appended(self):
+        # One observation gains sources while queries measure it with the
+        # NumPy kernel; a view of a live column would raise BufferError
+        store = HierarchicalGeoStore()
+        sources = 2 * HierarchicalGeoStore.VECTOR_MIN_SOURCES
+        for i in range(sources):
+            store.add_observation(37.0, -122.0, observation("flooded street", 3, 37.0, -122.0, float(i), i))
+        stop = threading.Event()
+        errors = []
+
+        def query():
+            try:
+                while not stop.is_set():
+                    self.assertEqual(len(store.query_radius(37.0, -122.0, 1.0)), 1)
+                    self.assertEqual(len(store.nearest_k(37.0, -122.0, 3)), 1)
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=query) for _ in range(2)]
+        for t in readers:
+            t.start()
+        try:
+            for i in range(sources, sources + 3000):
+                store.add_observation(37.0, -122.0, observation("flooded street", 3, 37.0, -122.0, float(i), i))
+        finally:
+            stop.set()
+            for t in readers:
+                t.join()
+        self.assertEqual(errors, [])
+        (o,) = distinct_observations(store)
+        self.assertEqual([len(o.times), len(o.lats), len(o.lons), len(o.frame_ids)], [sources + 3000] * 4)
+
+
+class AggregateTest(unittest.TestCase):
+    def check_aggregates(self, store):
+        want = {}
+        for key, obs in finest_bins(store).items():
+            for o in obs:
+                for coarse in store._coarse_keys(key):
+                    a = want.setdefault(coarse, {"count": 0, "sources": 0, "lat": 0.0, "lon": 0.0,
+                                                 "urgencies": collections.Counter(),
+                                                 "texts": collections.Counter()})
+                    a["count"] += 1
+                    a["sources"] += o.source_count
+                    a["lat"] += sum(o.lats)
+                    a["lon"] += sum(o.lons)
+                    a["urgencies"][o.urgency] += 1
+                    a["texts"][o.environment] += o.source_count
+        got = store.query_aggregates()
+        self.assertEqual(set(want), set(got))
+        for key, w in want.items():
+            g = got[key]
+            self.assertEqual((g.count, g.sources), (w["count"], w["sources"]), key)
+            self.assertAlmostEqual(g.lat_sum, w["lat"], places=6)
+            self.assertAlmostEqual(g.lon_sum, w["lon"], places=6)
+            self.assertEqual(g.urgencies, dict(w["urgencies"]), key)
+            self.assertEqual(g.max_urgency, max(w["urgencies"]), key)
+            if len(w["texts"]) <= CellAggregate.MAX_TEXTS:
+                self.assertEqual(g.texts, dict(w["texts"]), key)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(21)
+        for trial in range(8):
+            with self.subTest(trial=trial), tempfile.TemporaryDirectory() as data_dir:
+                run = RandomRun(rng, data_dir)
+                try:
+                    for _ in range(5):
+                        run.advance(60)
+                        self.check_aggregates(run.store)
+                    run.reopen()
+                    self.check_aggregates(run.store)
+                finally:
+                    run.close()
+
+
+def brute_top_urgent(observations, k):
+    return [o.obs_id for o in sorted(observations, key=lambda o: (-o.urgency, -o.obs_id))[:k]]
+
+
+class TopUrgentTest(unittest.TestCase):
+    def check_top(self, store):
+        bins = finest_bins(store)
+        everything = [o for obs in bins.values() for o in obs]
+        self.assertEqual([o.obs_id for o in store.top_urgent(10)], brute_top_urgent(everything, 10))
+        by_cell = collections.defaultdict(list)
+        for key, obs in bins.items():
+            by_cell[key] += obs
+            for coarse in store._coarse_keys(key):
+                by_cell[coarse] += obs
+        for key, obs in by_cell.items():
+            self.assertEqual([o.obs_id for o in store.top_urgent(3, key)], brute_top_urgent(obs, 3), key)
+        box = (37.75, -122.45, 37.9, -122.3)
+        inside = [o for o in everything
+                  if any(box[0] <= a <= box[2] and box[1] <= b <= box[3] for a, b in zip(o.lats, o.lons))]
+        self.assertEqual([o.obs_id for o in store.top_urgent(5, box)], brute_top_urgent(inside, 5))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(22)
+        for trial in range(8):
+            with self.subTest(trial=trial), tempfile.TemporaryDirectory() as data_dir:
+                run = RandomRun(rng, data_dir)
+                try:
+                    for _ in range(5):
+                        run.advance(60)
+                        self.check_top(run.store)
+                    run.reopen()
+                    self.check_top(run.store)
+                finally:
+                    run.close()
+
+    def test_concurrent_inserts_and_sweeps(self):
+        store = HierarchicalGeoStore(max_observations=300, sweep_batch=20, radius_levels=[0.1, 1.0, 10.0])
+        stop = threading.Event()
+        errors = []
+
+        def insert(seed):
+            rng = random.Random(seed)
+            try:
+                for i in range(1500):
+                    lat, lon = 37.7 + rng.random() * 0.3, -122.5 + rng.random() * 0.3
+                    store.add_observation(lat, lon, observation(
+                        rng.choice(TEXTS), rng.randint(1, 5), lat, lon, float(i), seed * 10000 + i))
+            except Exception as e:
+                errors.append(e)
+
+        def sweep():
+            while not stop.is_set():
+                store.sweep()
+                store.top_urgent(10)
+
+        sweeper = threading.Thread(target=sweep)
+        sweeper.start()
+        inserters = [threading.Thread(target=insert, args=(seed,)) for seed in range(4)]
+        for t in inserters:
+            t.start()
+        for t in inserters:
+            t.join()
+        stop.set()
+        sweeper.join()
+        self.assertEqual(errors, [])
+        self.check_top(store)
+        # Compaction brings every heap back to its live entries
+        store.sweep()
+        index = store.urgent
+        live = len(distinct_observations(store))
+        self.assertEqual(sum(heap.live for heap in index._global), live)
+        self.assertLessEqual(sum(len(heap.heap) for heap in index._global), 2 * live + 64 * index.STRIPES)
+
+
+class MergeTargetTest(unittest.TestCase):
+    """
+    GeoBin's candidate lookups against the linear simple_text_similarity scan
+    they replace: the first observation, in insertion order, that reaches
+    the threshold.
+    """
+    WORDS = "flooded street car fire fallen tree debris road".split()
+
+    def random_text(self, rng):
+        return " ".join(rng.sample(self.WORDS, rng.randint(1, 4)))
+
+    def linear_target(self, geo_bin, text, sim_threshold):
+        return next((i for i, o in enumerate(geo_bin.observations)
+                     if simple_text_similarity(o.environment, text) >= sim_threshold), None)
+
+    def test_token_index_matches_linear_scan(self):
+        rng = random.Random(3)
+        for sim_threshold in (0.0, 0.3, 0.6, 1.0):
+            with self.subTest(sim_threshold=sim_threshold):
+                geo_bin = GeoBin()
+                for i in range(400):
+                    text = self.random_text(rng)
+                    want = self.linear_target(geo_bin, text, sim_threshold)
+                    with geo_bin.lock:
+                        self.assertEqual(geo_bin._find_merge_target(frozenset(text.lower().split()),
+                                                                    sim_threshold), want)
+                    added = geo_bin.merge_or_add_observation(
+                        observation(text, 2, 37.0, -122.0, float(i), i), sim_threshold)
+                    self.assertEqual(added, want is None)
+
+    def test_verified_lsh_only_misses_pairs_outside_its_buckets(self):
+        rng = random.Random(4)
+        lsh = MinHashLSH(verify=True)
+        for sim_threshold in (0.3, 0.6, 0.9):
+            with self.subTest(sim_threshold=sim_threshold):
+                geo_bin = GeoBin(lsh=lsh)
+                for i in range(400):
+                    text = self.random_text(rng)
+                    tokens = frozenset(text.lower().split())
+                    signature = lsh.signature(tokens)
+                    buckets = set(lsh.band_keys(signature))
+                    shares_bucket = [bool(buckets.intersection(lsh.band_keys(o.signature)))
+                                     for o in geo_bin.observations]
+                    with geo_bin.lock:
+                        got = geo_bin._find_lsh_merge_target(tokens, signature, sim_threshold)
+                    # The linear scan restricted to bucket mates
+                    want = next((j for j, o in enumerate(geo_bin.observations) if shares_bucket[j]
+                                 and simple_text_similarity(o.environment, text) >= sim_threshold), None)
+                    self.assertEqual(got, want)
+                    if any(frozenset(o.environment.split()) == tokens for o in geo_bin.observations):
+                        # Identical token sets share every bucket, so are never missed
+                        self.assertIsNotNone(got)
+                    geo_bin.merge_or_add_observation(observation(text, 2, 37.0, -122.0, float(i), i),
+                                                     sim_threshold)
+
+
+class ReloadTest(unittest.TestCase):
+    def test_reopen_replays_same_bins(self):
+        rng = random.Random(9)
+        for trial in range(8):
+            with self.subTest(trial=trial), tempfile.TemporaryDirectory() as data_dir:
+                run = RandomRun(rng, data_dir)
+                try:
+                    for _ in range(5):
+                        run.advance(60)
+                        before = snapshot(run.store)
+                        run.reopen()
+                        self.assertEqual(snapshot(run.store), before)
+                        self.assertEqual(run.store.entry_count, len(distinct_observations(run.store)))
+                finally:
+                    run.close()
+
+    def test_insert_racing_drop_replays(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            store = HierarchicalGeoStore(data_dir=data_dir)
+            store.add_observation(37.0, -122.0, observation("fallen tree", 3, 37.0, -122.0, 0.0, 0))
+            (key, old), = store.bins.items()
+            add_tombstone = store._add_tombstone
+
+            def racing(k):
+                # Once, start an insert into the bin being dropped and give it
+                # time to block on (or slip past) the drop
+                store._add_tombstone = add_tombstone
+                inserter.start()
+                time.sleep(0.2)
+                return add_tombstone(k)
+
+            inserter = threading.Thread(target=store.add_observation, args=(
+                37.0, -122.0, observation("flooded street", 3, 37.0, -122.0, 1.0, 1)))
+            store._add_tombstone = racing
+            store._drop_bin(key, old, only_if_empty=False)
+            inserter.join()
+            store.add_observation(37.0, -122.0, observation("flooded street", 3, 37.0, -122.0, 2.0, 2))
+            before = snapshot(store)
+            self.assertEqual(sum(len(c) for c in store._children.values()), len(store.bins))
+            store.close()
+
+            reopened = HierarchicalGeoStore(data_dir=data_dir)
+            try:
+                self.assertEqual(snapshot(reopened), before)
+                self.assertEqual([(o.environment, list(o.frame_ids)) for o in distinct_observations(reopened)],
+                                 [("flooded street", [1, 2])])
+            finally:
+                reopened.close()
+
+    def test_inserts_run_while_snapshot_is_written(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            store = HierarchicalGeoStore(data_dir=data_dir)
+            store.add_observation(37.0, -122.0, observation("fallen tree", 3, 37.0, -122.0, 0.0, 0))
+            writing, release = threading.Event(), threading.Event()
+            write_snapshot = geo_log.write_snapshot
+
+            def slow_write(*args):
+                writing.set()
+                release.wait(5)
+                return write_snapshot(*args)
+
+            with mock.patch.object(geo_log, "write_snapshot", slow_write):
+                compactor = threading.Thread(target=store.snapshot)
+                compactor.start()
+                self.assertTrue(writing.wait(5))
+                inserter = threading.Thread(target=store.add_observation, args=(
+                    38.0, -122.0, observation("car on fire", 5, 38.0, -122.0, 1.0, 1)))
+                inserter.start()
+                inserter.join(2)
+                blocked = inserter.is_alive()
+                release.set()
+                compactor.join()
+                inserter.join()
+            self.assertFalse(blocked, "insert waited for the snapshot write")
+            before = snapshot(store)
+            store.close()
+            reopened = HierarchicalGeoStore(data_dir=data_dir)
+            try:
+                self.assertEqual(snapshot(reopened), before)
+            finally:
+                reopened.close()
+
+    def test_interrupted_compaction_recovers(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            store = HierarchicalGeoStore(data_dir=data_dir)
+            for i in range(3):
+                store.add_observation(37.0 + i, -122.0, observation("fallen tree", 3, 37.0 + i, -122.0, i, i))
+            with mock.patch.object(geo_log, "write_snapshot", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    store.snapshot()
+            store.add_observation(40.0, -122.0, observation("car on fire", 5, 40.0, -122.0, 3.0, 3))
+            with mock.patch.object(geo_log, "write_snapshot", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    store.snapshot()
+            store.add_observation(41.0, -122.0, observation("car on fire", 5, 41.0, -122.0, 4.0, 4))
+            before = snapshot(store)
+            store.close()
+            for _ in range(2):
+                reopened = HierarchicalGeoStore(data_dir=data_dir)
+                try:
+                    self.assertEqual(snapshot(reopened), before)
+                finally:
+                    reopened.close()
+
+
+if __name__ == "__main__":
+    unittest.main()